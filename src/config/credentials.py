@@ -12,3 +12,5 @@ CREDENTIALS['stock_analyser_database_url'] = os.getenv('STOCK_ANALYSER_DATABASE_
 
 # Get XTB credentials
 CREDENTIALS['xtb'] = keyring.get_password('xtb', CREDENTIALS['primary_user'])
+CREDENTIALS['xtb_secondary'] = keyring.get_password('xtb', CREDENTIALS['second_user']) \
+    if CREDENTIALS['second_user'] else None
@@ -1,3 +1,5 @@
+import os
+
 TICKER_SUFFIXES = {
     'FR': 'PA',
     'CH': 'SW',
@@ -15,6 +17,31 @@ TICKER_SUFFIXES = {
     'UK': 'L',
 }
 
+# Yahoo Finance extraction settings
+YAHOO_CHUNK_SIZE = 5  # Tickers per chunk in the sequential ETL
+YAHOO_CHUNK_SLEEP = 7  # Seconds to wait between chunks in the sequential ETL
+YAHOO_CONCURRENT_CHUNK_SIZE = 50  # Tickers per chunk in the concurrent ETL
+YAHOO_REQUESTS_PER_SECOND = 2.0
+YAHOO_BURST_SIZE = 5
+YAHOO_MAX_IN_FLIGHT = 4
+
+# Yahoo Finance response cache, time to live in seconds per dataset
+YAHOO_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.stockanalyser', 'yahoo_cache.sqlite')
+YAHOO_CACHE_MAX_BYTES = 512 * 1024 ** 2
+YAHOO_CACHE_TTL = {
+    'balance': 30 * 86400,
+    'income': 30 * 86400,
+    'cash': 30 * 86400,
+    'stats': 12 * 3600,
+    'profile': 7 * 86400,
+}
+
+# Days after the fiscal year-end after which new annual statements are expected to be published
+STATEMENT_REPORTING_LAG_DAYS = 120
+
+STATEMENT_TYPES = ('balance', 'income', 'cash')
+COMPANY_DATA_TYPES = STATEMENT_TYPES + ('stats', 'profile')
+
 PIOTROSKI_OUT_COLS = ['ticker',
                       'country',
                       'name',
@@ -31,3 +58,57 @@ PIOTROSKI_OUT_COLS = ['ticker',
                       'website',
                       'longBusinessSummary',
                       ]
+
+# Descriptive columns of the factor engine output, followed by one column per factor
+FACTOR_OUT_COLS = ['ticker',
+                   'country',
+                   'name',
+                   'lastAsofDate',
+                   'industry',
+                   'sector',
+                   'currency',
+                   'previousClose',
+                   'marketCap',
+                   'trailingPE',
+                   ]
+
+# SQL logging, echoing every statement to stdout is opt-in (STOCK_ANALYSER_SQL_ECHO=1)
+SQL_ECHO = os.getenv('STOCK_ANALYSER_SQL_ECHO', '0').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('STOCK_ANALYSER_SLOW_QUERY_MS', '500'))
+
+# Maximum number of bind parameters sent in a single statement (SQLite's historical limit, Postgres allows 32767)
+DB_MAX_BIND_PARAMS = 999
+
+# Resumable ETL, a failed chunk is retried by the resumed runs until it reaches the maximum number of attempts
+ETL_MAX_CHUNK_ATTEMPTS = 3
+
+# Pipelined Yahoo ETL, worker threads per stage, capacity of the queues between the stages and maximum load batch
+YAHOO_PIPELINE_TRANSFORM_WORKERS = 2
+YAHOO_PIPELINE_LOAD_WORKERS = 1
+YAHOO_PIPELINE_QUEUE_SIZE = 100
+YAHOO_PIPELINE_LOAD_BATCH_SIZE = 50
+
+# Number of the latest ticks kept in memory per symbol by the XTB tick store
+XTB_TICK_STORE_CAPACITY = 10000
+
+# Persistence of the streamed XTB ticks, rows per bulk insert, maximum time between two flushes (in seconds)
+# and the number of ticks buffered in memory before new ones are dropped
+XTB_TICK_BATCH_SIZE = 5000
+XTB_TICK_FLUSH_SECONDS = 1.0
+XTB_TICK_QUEUE_SIZE = 100000
+
+# On-disk XTB symbol catalog, it is refreshed from getAllSymbols once it is older than XTB_CATALOG_MAX_AGE seconds
+XTB_CATALOG_PATH = os.path.join(os.path.expanduser('~'), '.stockanalyser', 'xtb_symbols.npz')
+XTB_CATALOG_MAX_AGE = 24 * 60 * 60
+
+# XTB session keepalive, an idle session is pinged every XTB_PING_SECONDS, a socket silent for XTB_SOCKET_TIMEOUT
+# seconds is considered dead and a dropped session is logged in again up to XTB_RECONNECT_TRIES times
+XTB_PING_SECONDS = 60
+XTB_SOCKET_TIMEOUT = 30
+XTB_RECONNECT_TRIES = 5
+
+# XTB daily price history, one file per symbol under XTB_PRICES_PATH. New symbols are fetched XTB_HISTORY_YEARS back,
+# the symbols are requested in batches of XTB_HISTORY_BATCH_SIZE and every batch is stored before the next one
+XTB_PRICES_PATH = os.path.join(os.path.expanduser('~'), '.stockanalyser', 'xtb_prices')
+XTB_HISTORY_YEARS = 10
+XTB_HISTORY_BATCH_SIZE = 200
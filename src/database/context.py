@@ -0,0 +1,71 @@
+from typing import Union
+import threading
+from sqlalchemy import MetaData, Table
+from sqlalchemy.engine import Engine
+
+from .database import engine
+
+
+class DbContext:
+    def __init__(self, db_engine: Engine = engine):
+        """
+        Database context shared by all extractors, loaders and analysers of the process.
+
+        The schema is reflected once on first use and tables are looked up by name in a dict.
+        Only the engine and the reflected schema are shared. Connections are not thread-safe, every user checks
+        one out of the engine pool per use (engine.connect() / engine.begin()).
+        """
+        self._engine = db_engine
+        self._metadata: Union[MetaData, None] = None
+        self._tables: dict = dict()
+        self._lock = threading.RLock()
+
+    @property
+    def engine(self) -> Engine:
+        return self._engine
+
+    @property
+    def metadata(self) -> MetaData:
+        if self._metadata is None:
+            self.reflect()
+        return self._metadata
+
+    @property
+    def tables(self) -> dict:
+        if self._metadata is None:
+            self.reflect()
+        return self._tables
+
+    def reflect(self) -> None:
+        """(Re-)reflect the database schema, e.g. after new tables were created"""
+        with self._lock:
+            metadata = MetaData()
+            metadata.reflect(bind=self._engine)
+            self._metadata = metadata
+            self._tables = {tbl.fullname: tbl for tbl in metadata.tables.values()}
+
+    def get_table(self, tablename: str) -> Table:
+        if tablename not in self.tables:
+            # The table might have been created after the schema was reflected
+            self.reflect()
+        if tablename not in self._tables:
+            raise ValueError(f'{tablename} was not found in the database.')
+        return self._tables[tablename]
+
+    def dispose(self) -> None:
+        """Close the connections of the engine pool, e.g. in a newly forked process"""
+        with self._lock:
+            self._engine.dispose()
+
+
+_db_context: Union[DbContext, None] = None
+_db_context_lock = threading.Lock()
+
+
+def get_db_context() -> DbContext:
+    """Return the process-wide database context, created on first use"""
+    global _db_context
+    with _db_context_lock:
+        if _db_context is None:
+            _db_context = DbContext()
+        return _db_context
@@ -4,7 +4,8 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm.decl_api import DeclarativeMeta
 
-from src.config import CREDENTIALS
+from src.config import CREDENTIALS, SQL_ECHO, SLOW_QUERY_THRESHOLD_MS
+from .instrumentation import QueryStats
 
 BS_TABLENAME = 'sa_balance_sheet'
 PNL_TABLENAME = 'sa_profit_loss_statement'
@@ -14,13 +15,18 @@ COUNTRY_MAPPING_TABLENAME = 'sa_country_mapping'
 STOCK_PROFILE_TABLENAME = 'sa_stock_profile'
 PIOTROSKI_RESULTS_TABLENAME = 'sa_piotroski_results'
 ERRONEOUS_SYMBOLS_TABLENAME = 'sa_erroneous_symbols'
+ETL_RUN_JOURNAL_TABLENAME = 'sa_etl_run_journal'
+TICK_PRICES_TABLENAME = 'sa_tick_prices'
 
 db_url: str = CREDENTIALS['stock_analyser_database_url']
 
 engine: Engine = create_engine(
-    db_url, connect_args={'check_same_thread': False}, echo=True
+    db_url, connect_args={'check_same_thread': False}, echo=SQL_ECHO
 )
 
+query_stats: QueryStats = QueryStats(SLOW_QUERY_THRESHOLD_MS)
+query_stats.attach(engine)
+
 SessionLocal: sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base: DeclarativeMeta = declarative_base()
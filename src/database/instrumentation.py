@@ -0,0 +1,126 @@
+from typing import Union
+from collections import deque
+import bisect
+import logging
+import re
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('stockanalyser.sql')
+
+# Upper bounds (in ms) of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+_PARAM = r"(?:\?|%s|%\(\w+\)s|:\w+|'(?:[^']|'')*'|-?\d+(?:\.\d+)?)"
+_PARAM_LIST_RE = re.compile(r'\(\s*' + _PARAM + r'(?:\s*,\s*' + _PARAM + r')*\s*\)')
+_VALUES_LIST_RE = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(statement: str) -> str:
+    """Normalize the statement so that queries differing only in parameters or list lengths are grouped together"""
+    statement = _PARAM_LIST_RE.sub('(?)', statement)
+    statement = _VALUES_LIST_RE.sub('(?)', statement)
+    statement = _LITERAL_RE.sub('?', statement)
+    return _WHITESPACE_RE.sub(' ', statement).strip()
+
+
+class QueryStats:
+    def __init__(self, slow_query_ms: float = 500, max_slow_queries: int = 100):
+        """
+        Per query fingerprint latency histograms and row counts collected from SQLAlchemy engine events.
+
+        :param slow_query_ms: statements running longer than this are logged to the 'stockanalyser.sql' logger.
+        :param max_slow_queries: number of the latest slow statements kept in slow_queries.
+
+        Example:
+        stats = QueryStats(slow_query_ms=200)
+        stats.attach(engine)
+        stats.reset()  # at the start of every run
+        ...
+        print(stats.summary())
+        """
+        self._slow_query_ms = slow_query_ms
+        self._stats: dict = dict()
+        self._slow_queries: deque = deque(maxlen=max_slow_queries)
+        self._slow_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def slow_query_ms(self):
+        return self._slow_query_ms
+
+    @slow_query_ms.setter
+    def slow_query_ms(self, value):
+        self._slow_query_ms = value
+
+    @property
+    def stats(self) -> dict:
+        return self._stats
+
+    @property
+    def slow_queries(self) -> list:
+        return list(self._slow_queries)
+
+    def attach(self, engine: Engine) -> None:
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def detach(self, engine: Engine) -> None:
+        event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['query_start_time'].pop()) * 1000
+        self.record(statement, elapsed_ms, cursor.rowcount)
+
+    def record(self, statement: str, elapsed_ms: float, rowcount: Union[int, None] = None) -> None:
+        key = fingerprint(statement)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                         'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+                self._stats[key] = stats
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['histogram'][bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+            if rowcount is not None and rowcount > 0:
+                stats['rows'] += rowcount
+
+            if elapsed_ms >= self._slow_query_ms:
+                self._slow_queries.append((elapsed_ms, statement))
+                self._slow_count += 1
+                logger.warning('Slow query (%.1f ms): %s', elapsed_ms, statement)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats = dict()
+            self._slow_queries.clear()
+            self._slow_count = 0
+
+    def summary(self, top: int = 10) -> str:
+        """Text summary of the slowest query fingerprints by total time"""
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+            queries = sum(stats['count'] for stats in self._stats.values())
+            total_ms = sum(stats['total_ms'] for stats in self._stats.values())
+            slow = self._slow_count
+
+        buckets = [f'<={bound}ms' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+        lines = [f'SQL summary: {queries} queries, {total_ms:.1f} ms total, '
+                 f'{slow} slower than {self._slow_query_ms} ms.']
+        for key, stats in items[:top]:
+            histogram = ', '.join(f'{bucket}: {count}' for bucket, count in zip(buckets, stats['histogram']) if count)
+            lines.append(f"  {stats['count']}x, {stats['total_ms']:.1f} ms total, "
+                         f"{stats['total_ms'] / stats['count']:.2f} ms avg, {stats['max_ms']:.1f} ms max, "
+                         f"{stats['rows']} rows [{histogram}] {key[:200]}")
+        return '\n'.join(lines)
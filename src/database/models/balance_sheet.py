@@ -1,9 +1,10 @@
-from sqlalchemy import Column, BigInteger, Date, String
+from sqlalchemy import Column, Index, BigInteger, Date, String
 from ..database import Base, BS_TABLENAME
 
 
 class BalanceSheet(Base):
     __tablename__ = BS_TABLENAME
+    __table_args__ = (Index(f'ix_{BS_TABLENAME}_ticker_country', 'ticker', 'country'),)
 
     asof_date = Column(Date, primary_key=True, index=True, nullable=False)
     ticker = Column(String, primary_key=True, index=True, nullable=False)
@@ -13,3 +14,10 @@ class BalanceSheet(Base):
     currentAssets = Column(BigInteger)
     currentLiabilities = Column(BigInteger)
     commonStock = Column(BigInteger)
+    retainedEarnings = Column(BigInteger)
+    totalLiabilitiesNetMinorityInterest = Column(BigInteger)
+    stockholdersEquity = Column(BigInteger)
+    accountsReceivable = Column(BigInteger)
+    netPPE = Column(BigInteger)
+    totalDebt = Column(BigInteger)
+    cashAndCashEquivalents = Column(BigInteger)
@@ -1,11 +1,13 @@
-from sqlalchemy import Column, BigInteger, Date, String
+from sqlalchemy import Column, Index, BigInteger, Date, String
 from ..database import Base, CF_TABLENAME
 
 
 class CashFlowStmt(Base):
     __tablename__ = CF_TABLENAME
+    __table_args__ = (Index(f'ix_{CF_TABLENAME}_ticker_country', 'ticker', 'country'),)
 
     asof_date = Column(Date, primary_key=True, index=True, nullable=False)
     ticker = Column(String, primary_key=True, index=True, nullable=False)
     country = Column(String, primary_key=True, nullable=False)
     operatingCashFlow = Column(BigInteger)
+    depreciationAndAmortization = Column(BigInteger)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Index, Float, DateTime, String, Integer
+from ..database import Base, ETL_RUN_JOURNAL_TABLENAME
+
+
+class EtlRunJournal(Base):
+    __tablename__ = ETL_RUN_JOURNAL_TABLENAME
+    __table_args__ = (Index(f'ix_{ETL_RUN_JOURNAL_TABLENAME}_run_id_status', 'run_id', 'status'),)
+
+    run_id = Column(String, primary_key=True, nullable=False)
+    chunk_id = Column(Integer, primary_key=True, nullable=False)
+    country = Column(String, nullable=False)
+    symbols = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False)
+    error = Column(String)
+    extract_seconds = Column(Float)
+    transform_seconds = Column(Float)
+    load_seconds = Column(Float)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
@@ -1,9 +1,10 @@
-from sqlalchemy import Column, BigInteger, Date, String
+from sqlalchemy import Column, Index, BigInteger, Date, String
 from ..database import Base, PNL_TABLENAME
 
 
 class ProfitLossStmt(Base):
     __tablename__ = PNL_TABLENAME
+    __table_args__ = (Index(f'ix_{PNL_TABLENAME}_ticker_country', 'ticker', 'country'),)
 
     asof_date = Column(Date, primary_key=True, index=True, nullable=False)
     ticker = Column(String, primary_key=True, index=True, nullable=False)
@@ -11,3 +12,6 @@ class ProfitLossStmt(Base):
     netIncome = Column(BigInteger)
     totalRevenue = Column(BigInteger)
     grossProfit = Column(BigInteger)
+    costOfRevenue = Column(BigInteger)
+    sellingGeneralAndAdministration = Column(BigInteger)
+    ebit = Column(BigInteger)
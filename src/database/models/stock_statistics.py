@@ -1,9 +1,10 @@
-from sqlalchemy import Column, Float, Date, String, BigInteger
+from sqlalchemy import Column, Index, Float, Date, String, BigInteger
 from ..database import Base, STATS_TABLENAME
 
 
 class StockStatistics(Base):
     __tablename__ = STATS_TABLENAME
+    __table_args__ = (Index(f'ix_{STATS_TABLENAME}_ticker_country', 'ticker', 'country'),)
 
     asof_date = Column(Date, primary_key=True, index=True, nullable=False)
     ticker = Column(String, primary_key=True, index=True, nullable=False)
@@ -14,3 +15,4 @@ class StockStatistics(Base):
     volume = Column(Float)
     marketCap = Column(BigInteger)
     twoHundredDayAverage = Column(Float)
+    previousClose = Column(Float)
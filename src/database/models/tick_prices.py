@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Float, String, BigInteger, Integer
+from ..database import Base, TICK_PRICES_TABLENAME
+
+
+class TickPrice(Base):
+    __tablename__ = TICK_PRICES_TABLENAME
+
+    symbol = Column(String, primary_key=True, nullable=False)
+    timestamp = Column(BigInteger, primary_key=True, nullable=False)
+    level = Column(Integer, primary_key=True, nullable=False)
+    bid = Column(Float)
+    ask = Column(Float)
+    bidVolume = Column(Float)
+    askVolume = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    spreadRaw = Column(Float)
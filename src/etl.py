@@ -1,53 +1,356 @@
 # TODO Change country suffixes to accept list of values
 
+from typing import Union
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import time
+import pandas as pd
 
 from src.extractor.db_extractor import DbExtractor
 from src.extractor.xtb_extractor import XtbExtractor
+from src.extractor.xtb_price_extractor import XtbPriceExtractor
 from src.extractor.yahoo_extractor import YahooExtractor
 from src.transformer.yahoo_transformer import YahooTransformer
 from src.transformer.xtb_transformer import XtbTransformer
 from src.loader.db_loader import DbLoader
+from src.database.database import query_stats
+from src.database.context import get_db_context
 
-from src.utils.auxiliary import grouper, process_symbols
-from src.utils.exceptions import EmptyStatementError
+from src.config.variables import YAHOO_CHUNK_SIZE, YAHOO_CHUNK_SLEEP, YAHOO_CONCURRENT_CHUNK_SIZE, \
+    YAHOO_REQUESTS_PER_SECOND, YAHOO_BURST_SIZE, YAHOO_MAX_IN_FLIGHT, YAHOO_CACHE_PATH, YAHOO_CACHE_TTL, \
+    YAHOO_CACHE_MAX_BYTES, YAHOO_PIPELINE_TRANSFORM_WORKERS, YAHOO_PIPELINE_LOAD_WORKERS, YAHOO_PIPELINE_QUEUE_SIZE, \
+    YAHOO_PIPELINE_LOAD_BATCH_SIZE, COMPANY_DATA_TYPES
+from src.utils.auxiliary import process_symbols
+from src.utils.exceptions import EmptyStatementError, TransportError
+from src.utils.rate_limiter import TokenBucket, ProcessTokenBucket
+from src.utils.response_cache import ResponseCache
+from src.utils.erroneous_registry import ErroneousRegistry
+from src.utils.run_journal import RunJournal
+from src.utils.pipeline import Pipeline, Stage
 
 
-def yahoo_etl():
-    """Run ETL on YAHOO data"""
+def _get_yahoo_symbols(incremental: bool = False) -> tuple:
+    """Get the symbols of the universe that still need loading grouped by country along with the loaded ones"""
     db_extractor = DbExtractor(auto_login=True)
     symbols = db_extractor.get_table_contents('sa_country_mapping')
     symbols = process_symbols(symbols)
+    erroneous = ErroneousRegistry()
+
+    # Finding the already loaded symbols once for the whole universe instead of once per chunk
+    loaded = set() if incremental else db_extractor.get_loaded_symbols()
+    symbols = {country: [comp for comp in companies
+                         if (comp, country) not in loaded and (comp, country) not in erroneous]
+               for country, companies in symbols.items()}
+    return symbols, loaded
+
+
+def _run_yahoo_chunks(country: str,
+                      chunks: list,
+                      rate_limiter: Union[TokenBucket, None] = None,
+                      cache: Union[ResponseCache, None] = None,
+                      incremental: bool = False,
+                      loaded: Union[set, None] = None,
+                      chunk_sleep: float = 0,
+                      journal: Union[RunJournal, None] = None) -> dict:
+    """
+    Run the Yahoo ETL of a single country chunk by chunk.
+
+    :param chunks: list of (chunk_id, [tickers]) as planned by RunJournal.plan.
+    :param journal: if passed, the stages of every chunk are recorded in the run journal and a chunk failing
+    with an exception is marked as failed instead of stopping the run, so that a resumed run retries it.
+    :return: Python dict summarizing the run: number of symbols and chunks, upserted row counts per data type
+    and the number of symbols and chunks that failed.
+    """
+    erroneous = ErroneousRegistry()
+    summary = {'country': country, 'symbols': sum(len(chunk) for _, chunk in chunks), 'chunks': 0, 'failed': 0,
+               'failed_chunks': 0, 'rows': dict()}
+
+    for chunk_id, chunk in chunks:
+        print(f'Processing {country} - {chunk} please wait...')
+        summary['chunks'] += 1
+        if journal is not None:
+            journal.start(chunk_id)
+
+        try:
+            counts = _run_yahoo_chunk(country, chunk, chunk_id, rate_limiter, cache, incremental, loaded,
+                                      erroneous, journal)
+        except Exception as e:
+            if journal is None:
+                raise
+            journal.mark(chunk_id, RunJournal.FAILED, error=f'{type(e).__name__}: {e}')
+            summary['failed_chunks'] += 1
+            print(f'{country} - {chunk} failed. Reason: {e}')
+            continue
+        finally:
+            summary['failed'] += erroneous.flush()
+
+        if counts is None:
+            continue
+        for data_type, data_counts in counts.items():
+            rows = summary['rows'].setdefault(data_type, {'inserted': 0, 'updated': 0, 'unchanged': 0})
+            for key, value in data_counts.items():
+                rows[key] += value
+        print(f'{country} - {chunk} have been processed by the ETL... {counts}')
+        if chunk_sleep:
+            time.sleep(chunk_sleep)  # To avoid sending too many requests to Yahoo API in a short period of time
+
+    return summary
+
+
+def _run_yahoo_chunk(country: str,
+                     chunk: list,
+                     chunk_id: Union[int, None],
+                     rate_limiter: Union[TokenBucket, None],
+                     cache: Union[ResponseCache, None],
+                     incremental: bool,
+                     loaded: Union[set, None],
+                     erroneous: ErroneousRegistry,
+                     journal: Union[RunJournal, None] = None) -> Union[dict, None]:
+    """
+    Extract, transform and load one chunk, returns the upserted row counts or None if there was no data.
+    Raises TransportError if any symbol of the chunk could not be fetched because of a network or HTTP failure.
+    """
+    def mark(status, started=None):
+        if journal is not None:
+            journal.mark(chunk_id, status, time.perf_counter() - started if started is not None else None)
+
+    # Extract
+    started = time.perf_counter()
+    ye = YahooExtractor(grouped_symbols={country: chunk}, rate_limiter=rate_limiter, cache=cache,
+                        incremental=incremental, erroneous_registry=erroneous, loaded_symbols=loaded)
+    yh_data = ye.get_data()
+
+    # The chunk fails and is retried by a resumed run, it is only empty when Yahoo Finance answered without data
+    if ye.transport_errors:
+        raise TransportError(f'{len(ye.transport_errors)} symbols could not be fetched, '
+                             f'e.g. {next(iter(ye.transport_errors.values()))}')
+    if not all(bool(d) for d in yh_data.values()):
+        mark(RunJournal.EMPTY)
+        return None
+    mark(RunJournal.EXTRACTED, started)
+
+    try:
+        # Transform
+        started = time.perf_counter()
+        yt = YahooTransformer(yh_data, watermarks=ye.watermarks, erroneous_registry=erroneous)
+        yh_transformed = yt.process_data()
+    except EmptyStatementError:
+        mark(RunJournal.EMPTY)
+        return None
+    mark(RunJournal.TRANSFORMED, started)
+
+    # Load
+    started = time.perf_counter()
+    db_loader = DbLoader(auto_login=True)
+    counts = db_loader.upsert_statements(yh_transformed)
+    mark(RunJournal.LOADED, started)
+    return counts
+
+
+def yahoo_etl(concurrent: bool = False,
+              use_cache: bool = True,
+              incremental: bool = False,
+              resume: bool = False,
+              run_id: Union[str, None] = None):
+    """
+    Run ETL on YAHOO data
+
+    :param concurrent: if True, the tickers are queried concurrently and the request rate is governed by a token bucket
+    (YAHOO_REQUESTS_PER_SECOND, YAHOO_BURST_SIZE, YAHOO_MAX_IN_FLIGHT) instead of sleeping between the chunks.
+    :param use_cache: if True, Yahoo responses are kept in the on-disk cache (YAHOO_CACHE_PATH) and re-runs within
+    the YAHOO_CACHE_TTL of a dataset do not query Yahoo Finance again.
+    :param incremental: if True, already loaded symbols are extracted again when new annual statements are due
+    and only the rows newer than the loaded ones are written.
+    :param resume: if True, an interrupted run is continued from its journal: the completed chunks are skipped
+    and the failed or unfinished ones are retried up to ETL_MAX_CHUNK_ATTEMPTS times.
+    :param run_id: run to resume, defaults to the most recently started run.
+    :return: the run id, pass it to a later call with resume=True to continue the run.
+    """
+    query_stats.reset()
+    rate_limiter = TokenBucket(YAHOO_REQUESTS_PER_SECOND, YAHOO_BURST_SIZE, YAHOO_MAX_IN_FLIGHT) if concurrent else None
+    cache = ResponseCache(YAHOO_CACHE_PATH, YAHOO_CACHE_TTL, YAHOO_CACHE_MAX_BYTES) if use_cache else None
+    chunk_size = YAHOO_CONCURRENT_CHUNK_SIZE if concurrent else YAHOO_CHUNK_SIZE
+
+    journal, chunks, loaded = _plan_yahoo_run(chunk_size, incremental, resume, run_id)
+    print(f'ETL run {journal.run_id}: {sum(len(c) for c in chunks.values())} chunks to process.')
 
     # symbols = {'DE': ['NVD']}
 
     # Due to the amount of companies, run the ETL in chunks
-    for ticker, companies in symbols.items():
-        for chunk in grouper(companies, 5):
-            chunk = [x for x in chunk if x is not None]
-            print(f'Processing {ticker} - {chunk} please wait...')
-            d = {ticker: chunk}
-
-            # Extract
-            ye = YahooExtractor(grouped_symbols=d)
-            yh_data = ye.get_data()
-
-            if all(bool(d) for d in yh_data.values()):
-                try:
-                    # Transform
-                    yt = YahooTransformer(yh_data)
-                    yh_transformed = yt.process_data()
-                except EmptyStatementError:
-                    continue
-                # Load
-                db_loader = DbLoader(auto_login=True)
-                db_loader.load_statements(yh_transformed)
-                print(f'{ticker} - {chunk} have been processed by the ETL...')
-                time.sleep(7)  # To avoid sending too many requests to Yahoo API in a short period of time
+    for country, country_chunks in chunks.items():
+        _run_yahoo_chunks(country, country_chunks, rate_limiter, cache, incremental, loaded,
+                          chunk_sleep=0 if concurrent else YAHOO_CHUNK_SLEEP, journal=journal)
+
+    print(f'ETL run {journal.run_id} finished: {journal.summary()}')
+    if cache is not None:
+        print(cache.summary())
+        cache.close()
+    print(query_stats.summary())
+    return journal.run_id
+
+
+def _plan_yahoo_run(chunk_size: int,
+                    incremental: bool = False,
+                    resume: bool = False,
+                    run_id: Union[str, None] = None) -> tuple:
+    """Start a new journaled run or open the one to resume, returns the journal, its chunks and the loaded symbols"""
+    if resume:
+        journal = RunJournal.resume(run_id)
+        chunks = journal.pending_chunks()
+        # The loaded symbols are only used to skip already loaded tickers, the chunks were filtered when planned
+        loaded = set() if incremental else DbExtractor(auto_login=True).get_loaded_symbols()
+    else:
+        symbols, loaded = _get_yahoo_symbols(incremental)
+        journal = RunJournal(run_id)
+        chunks = journal.plan(symbols, chunk_size)
+    return journal, chunks, loaded
+
+
+def pipelined_yahoo_etl(use_cache: bool = True,
+                        incremental: bool = False,
+                        extract_workers: int = YAHOO_MAX_IN_FLIGHT,
+                        transform_workers: int = YAHOO_PIPELINE_TRANSFORM_WORKERS,
+                        load_workers: int = YAHOO_PIPELINE_LOAD_WORKERS,
+                        queue_size: int = YAHOO_PIPELINE_QUEUE_SIZE,
+                        load_batch_size: int = YAHOO_PIPELINE_LOAD_BATCH_SIZE) -> Pipeline:
+    """
+    Run ETL on YAHOO data as a streaming pipeline.
+
+    Extract, transform and load run at the same time as stages connected by bounded queues, every symbol flows
+    through them on its own. The extract workers share a token bucket (YAHOO_REQUESTS_PER_SECOND, YAHOO_BURST_SIZE)
+    charged per request sent to Yahoo Finance, the load workers upsert the symbols that are waiting for them
+    in one transaction of up to load_batch_size symbols.
+
+    :return: the finished Pipeline, its summary shows the busy time of every stage.
+    """
+    query_stats.reset()
+    rate_limiter = TokenBucket(YAHOO_REQUESTS_PER_SECOND, YAHOO_BURST_SIZE, extract_workers)
+    cache = ResponseCache(YAHOO_CACHE_PATH, YAHOO_CACHE_TTL, YAHOO_CACHE_MAX_BYTES) if use_cache else None
+    erroneous = ErroneousRegistry()
+
+    symbols, loaded = _get_yahoo_symbols(incremental)
+    watermarks = DbExtractor(auto_login=True).get_watermarks(COMPANY_DATA_TYPES) if incremental else None
+
+    def extract(symbol):
+        ticker, country = symbol
+        # The extractor takes a token per dataset it requests, cached datasets are free
+        ye = YahooExtractor(grouped_symbols={country: [ticker]}, rate_limiter=rate_limiter, cache=cache,
+                            incremental=incremental, erroneous_registry=erroneous, loaded_symbols=loaded,
+                            watermarks=watermarks)
+        yh_data = ye.get_data()
+        return yh_data if all(bool(d) for d in yh_data.values()) else None
+
+    def transform(yh_data):
+        try:
+            return YahooTransformer(yh_data, watermarks=watermarks, erroneous_registry=erroneous).process_data()
+        except EmptyStatementError:
+            return None
+
+    def load(batch):
+        statements = {data_type: pd.concat([item[data_type] for item in batch], ignore_index=True)
+                      for data_type in batch[0]}
+        counts = DbLoader(auto_login=True).upsert_statements(statements)
+        erroneous.flush()
+        print(f'{len(batch)} symbols have been processed by the ETL... {counts}')
+
+    pipeline = Pipeline([Stage('extract', extract, extract_workers),
+                         Stage('transform', transform, transform_workers),
+                         Stage('load', load, load_workers, load_batch_size)],
+                        queue_size)
+    try:
+        pipeline.run((comp, country) for country, companies in symbols.items() for comp in companies)
+    finally:
+        erroneous.flush()
+
+    print(pipeline.summary())
+    if cache is not None:
+        print(cache.summary())
+        cache.close()
+    print(query_stats.summary())
+    return pipeline
+
+
+_worker_rate_limiter: Union[TokenBucket, None] = None
+
+
+def _init_yahoo_worker(rate_limiter: TokenBucket) -> None:
+    """Process pool initializer, every worker gets the shared rate limiter and its own database connections"""
+    global _worker_rate_limiter
+    _worker_rate_limiter = rate_limiter
+    get_db_context().dispose()
+
+
+def _run_yahoo_shard(country: str,
+                     chunks: list,
+                     use_cache: bool,
+                     incremental: bool,
+                     loaded: set,
+                     run_id: str) -> dict:
+    cache = ResponseCache(YAHOO_CACHE_PATH, YAHOO_CACHE_TTL, YAHOO_CACHE_MAX_BYTES) if use_cache else None
+    try:
+        return _run_yahoo_chunks(country, chunks, _worker_rate_limiter, cache, incremental, loaded,
+                                 journal=RunJournal(run_id))
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def parallel_yahoo_etl(max_workers: Union[int, None] = None,
+                       use_cache: bool = True,
+                       incremental: bool = False,
+                       resume: bool = False,
+                       run_id: Union[str, None] = None) -> list:
+    """
+    Run ETL on YAHOO data in a process pool sharded by country.
+
+    Every worker process handles whole countries with its own database engine connections. The request rate
+    of all workers together is governed by one shared token bucket (YAHOO_REQUESTS_PER_SECOND, YAHOO_BURST_SIZE,
+    YAHOO_MAX_IN_FLIGHT), the parent process reports the progress and failures of every shard.
+    The run is journaled like yahoo_etl and can be resumed the same way.
+
+    :param max_workers: number of worker processes, defaults to the number of CPUs.
+    :return: list of the shard summaries.
+    """
+    journal, shards, loaded = _plan_yahoo_run(YAHOO_CONCURRENT_CHUNK_SIZE, incremental, resume, run_id)
+    shards = {country: chunks for country, chunks in shards.items() if chunks}
+    sizes = {country: sum(len(chunk) for _, chunk in chunks) for country, chunks in shards.items()}
+    total = sum(sizes.values())
+    print(f'ETL run {journal.run_id}: {total} symbols in {len(shards)} shards to process.')
+
+    rate_limiter = ProcessTokenBucket(YAHOO_REQUESTS_PER_SECOND, YAHOO_BURST_SIZE, YAHOO_MAX_IN_FLIGHT)
+    # Dropping the parent connections so that no socket is shared with the forked workers
+    get_db_context().dispose()
+
+    summaries, done = list(), 0
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_yahoo_worker,
+                             initargs=(rate_limiter,)) as executor:
+        futures = {executor.submit(_run_yahoo_shard, country, chunks, use_cache, incremental,
+                                   {symb for symb in loaded if symb[1] == country}, journal.run_id): country
+                   for country, chunks in shards.items()}
+
+        for future in as_completed(futures):
+            country = futures[future]
+            done += sizes[country]
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary = {'country': country, 'symbols': sizes[country], 'error': str(e)}
+                print(f'Shard {country} failed. Reason: {e}')
+            else:
+                print(f"Shard {country} finished: {summary['symbols']} symbols, {summary['failed']} failed, "
+                      f"{summary['failed_chunks']} failed chunks, rows {summary['rows']}.")
+            summaries.append(summary)
+            print(f'Progress: {done}/{total} symbols, {len(summaries)}/{len(shards)} shards.')
+
+    failed = sum(summary.get('failed', 0) for summary in summaries)
+    errors = [summary['country'] for summary in summaries if 'error' in summary]
+    print(f'Parallel Yahoo ETL finished: {total} symbols, {failed} failed symbols, failed shards: {errors or None}.')
+    print(f'ETL run {journal.run_id}: {journal.summary()}')
+    return summaries
 
 
 def xtb_etl():
     """Run ETL on XTB data"""
+    query_stats.reset()
     # Extract
     xtb = XtbExtractor(auto_login=True)
     names = xtb.get_names(category='STC')
@@ -59,6 +362,14 @@ def xtb_etl():
     # Load
     loader = DbLoader(True)
     loader.load_country_mapping(names_df)
+    print(query_stats.summary())
 
 
-
+def xtb_price_etl(category: str = 'STC') -> dict:
+    """Update the stored daily price history of the XTB symbols of the category"""
+    prices = XtbPriceExtractor(auto_login=False)
+    try:
+        prices.connect()
+        return prices.get_data(category)
+    finally:
+        prices.disconnect()
@@ -1,3 +1,4 @@
 from .xtb_extractor import XtbExtractor
+from .xtb_price_extractor import XtbPriceExtractor
 from .yahoo_extractor import YahooExtractor
 from .db_extractor import DbExtractor
@@ -1,20 +1,21 @@
-from sqlalchemy import select, MetaData
+from sqlalchemy import select, tuple_, func, null, exists
 from sqlalchemy.sql import and_
 import pandas as pd
 from typing import Union
 
 from .data_extractor import DataExtractor
-from src.database.database import engine
+from src.config.variables import DB_MAX_BIND_PARAMS
+from src.database.context import DbContext, get_db_context
 from src.database.models import balance_sheet, profit_loss_statement, \
     cashflow_statement, stock_statistics, country_mapping, stock_profile, erroneous_symbols
 
 
 class DbExtractor(DataExtractor):
-    def __init__(self, auto_login=False):
+    def __init__(self, auto_login=False, db_context: Union[DbContext, None] = None):
         super().__init__()
 
-        self._db_engine = engine
-        self._conn = None
+        self._db_context = db_context if db_context is not None else get_db_context()
+        self._db_engine = self._db_context.engine
         self._balance_tbl = balance_sheet.BalanceSheet
         self._income_tbl = profit_loss_statement.ProfitLossStmt
         self._cashflow_table = cashflow_statement.CashFlowStmt
@@ -23,18 +24,23 @@ class DbExtractor(DataExtractor):
         self._country_mapping = country_mapping.CountryMapping
         self._erroneous_symbols = erroneous_symbols.ErroneousSymbols
 
-        self._metadata = MetaData()
-        self._metadata.reflect(bind=self._db_engine)
+        self._metadata = self._db_context.metadata
 
         if auto_login:
             self.connect()
 
     def connect(self):
-        self._conn = engine.connect()
+        """Every query checks out its own connection of the engine pool, so there is nothing to open"""
+        pass
 
     def disconnect(self):
-        self._conn.close()
-        self._db_engine.dispose()
+        """The connections are returned to the engine pool after every query, use DbContext.dispose to close them"""
+        pass
+
+    def _execute(self, query) -> list:
+        # A connection per query, so one extractor can be used from many threads
+        with self._db_engine.connect() as conn:
+            return conn.execute(query).fetchall()
 
     def get_data(self):
         pass
@@ -43,42 +49,132 @@ class DbExtractor(DataExtractor):
         df = self.get_table_contents('sa_erroneous_symbols')
         return df['ticker'].values.tolist()
 
+    def get_loaded_symbols(self, symbols: Union[list, None] = None) -> set:
+        """
+        Get the symbols present in all statement, statistics and profile tables.
+
+        The tables are matched on both ticker and country with EXISTS subqueries backed by the (ticker, country) indexes.
+
+        :param symbols: optional list of (ticker, country) pairs to check, all loaded symbols are returned if None.
+        :return: Python set of (ticker, country) pairs.
+        """
+        blnc = self._balance_tbl
+
+        def loaded_in(model):
+            return exists().where(and_(model.ticker == blnc.ticker, model.country == blnc.country))
+
+        query = select([blnc.ticker, blnc.country]).distinct() \
+            .where(and_(*[loaded_in(model) for model in (self._income_tbl, self._cashflow_table,
+                                                         self._stock_stats, self._stock_profile)]))
+
+        if symbols is None:
+            return set((ticker, country) for ticker, country in self._execute(query))
+
+        pairs = list(dict.fromkeys(tuple(pair) for pair in symbols))
+        chunk_size = max(DB_MAX_BIND_PARAMS // 2, 1)
+        result = set()
+        for i in range(0, len(pairs), chunk_size):
+            chunk_query = query.where(tuple_(blnc.ticker, blnc.country).in_(pairs[i:i + chunk_size]))
+            result.update((ticker, country) for ticker, country in self._execute(chunk_query))
+        return result
+
+    def get_missing_symbols(self, symbols: list) -> list:
+        """Return the passed (ticker, country) pairs that still need loading, in the passed order"""
+        loaded = self.get_loaded_symbols(symbols)
+        return [tuple(pair) for pair in symbols if tuple(pair) not in loaded]
+
     def get_all_tickers(self, output_type: str = 'ticker') -> list:
-        query = select([self._balance_tbl.ticker, self._balance_tbl.country]). \
-            where(and_(self._balance_tbl.ticker.in_(select([self._income_tbl.ticker], from_obj=self._income_tbl)),
-                       self._balance_tbl.ticker.in_(select([self._cashflow_table.ticker], from_obj=self._cashflow_table)),
-                       self._balance_tbl.ticker.in_(select([self._stock_stats.ticker], from_obj=self._stock_stats)),
-                       self._balance_tbl.ticker.in_(select([self._stock_profile.ticker], from_obj=self._stock_profile))))
+        loaded = self.get_loaded_symbols()
         if output_type == 'ticker':
-            return list(set([tick[0] for tick in self._conn.execute(query)]))
+            return list(set([tick[0] for tick in loaded]))
         elif output_type == 'symbol':
-            return list(set([f'{tick[0]}-{tick[1]}' for tick in self._conn.execute(query)]))
+            return list(set([f'{tick[0]}-{tick[1]}' for tick in loaded]))
         else:
             raise ValueError(f"Wrong output_type. 'ticker' or 'symbol' accepted. {output_type} passed.")
 
     def get_all_symbols(self) -> list:
-        query = select([self._balance_tbl.ticker, self._balance_tbl.country]). \
-            where(and_(self._balance_tbl.ticker.in_(select([self._income_tbl.ticker], from_obj=self._income_tbl)),
-                       self._balance_tbl.ticker.in_(select([self._cashflow_table.ticker], from_obj=self._cashflow_table)),
-                       self._balance_tbl.ticker.in_(select([self._stock_stats.ticker], from_obj=self._stock_stats)),
-                       self._balance_tbl.ticker.in_(select([self._stock_profile.ticker], from_obj=self._stock_profile))))
-        result = list(set([tick[0] for tick in self._conn.execute(query)]))
-        return result
+        return self.get_all_tickers('ticker')
+
+    def _get_table(self, tablename: str):
+        return self._db_context.get_table(tablename)
+
+    def _get_model(self, data_type: str):
+        models = {'balance': self._balance_tbl,
+                  'income': self._income_tbl,
+                  'cash': self._cashflow_table,
+                  'stats': self._stock_stats,
+                  'profile': self._stock_profile}
+        if data_type not in models:
+            raise ValueError(f"Wrong data_type. {', '.join(models)} accepted. {data_type} passed.")
+        return models[data_type]
+
+    def get_watermarks(self, data_types: Union[list, tuple] = ('balance', 'income', 'cash')) -> dict:
+        """
+        Get the latest loaded asof_date of every symbol, one grouped query per table.
+
+        :param data_types: datasets to check. Any of 'balance', 'income', 'cash', 'stats' and 'profile'.
+        :return: Python dict {(ticker, country): {data_type: latest asof_date}}. Tables without asof_date
+        (e.g. profile) map the loaded symbols to None.
+        """
+        watermarks = dict()
+        for data_type in data_types:
+            model = self._get_model(data_type)
+            if hasattr(model, 'asof_date'):
+                query = select([model.ticker, model.country, func.max(model.asof_date)]) \
+                    .group_by(model.ticker, model.country)
+            else:
+                query = select([model.ticker, model.country, null()])
+            for ticker, country, asof_date in self._execute(query):
+                watermarks.setdefault((ticker, country), dict())[data_type] = asof_date
+        return watermarks
 
     def get_table_contents(self,
                            tablename: str,
                            filter_kwargs: Union[dict, None] = None) -> pd.DataFrame:
-        names = self._db_engine.table_names()
-        if tablename not in names:
-            raise ValueError(f'{tablename} was not found in the database.')
-
-        tbl = [tbl for tbl in list(self._metadata.tables.values()) if tbl.fullname == tablename][0]
+        tbl = self._get_table(tablename)
 
         if filter_kwargs is not None:
             query = tbl.select().filter_by(**filter_kwargs)
         else:
             query = tbl.select()
 
-        result = self._conn.execute(query).fetchall()
+        result = self._execute(query)
         df = pd.DataFrame(result, columns=tbl.columns.keys())
         return df
+
+    def get_bulk_table_contents(self,
+                                tablename: str,
+                                symbols: list) -> pd.DataFrame:
+        """
+        Get the table rows of many symbols at once.
+
+        :param tablename: name of the table to query.
+        :param symbols: list of (ticker, country) pairs. The pairs are sent in chunks that fit into
+        DB_MAX_BIND_PARAMS, so the number of queries is independent of the number of symbols in practice.
+        :return: Pandas DataFrame with the rows of all passed symbols.
+        """
+        tbl = self._get_table(tablename)
+        pairs = list(dict.fromkeys(tuple(pair) for pair in symbols))
+        chunk_size = max(DB_MAX_BIND_PARAMS // 2, 1)
+
+        result = list()
+        for i in range(0, len(pairs), chunk_size):
+            query = tbl.select().where(tuple_(tbl.c.ticker, tbl.c.country).in_(pairs[i:i + chunk_size]))
+            result.extend(self._execute(query))
+
+        df = pd.DataFrame(result, columns=tbl.columns.keys())
+        return df
+
+    def get_grouped_table_contents(self,
+                                   tablename: str,
+                                   symbols: list) -> dict:
+        """
+        Get the table rows of many symbols at once grouped by symbol.
+
+        :return: Python dict {'ticker-country': Pandas DataFrame}. Symbols without any rows get an empty DataFrame.
+        """
+        df = self.get_bulk_table_contents(tablename, symbols)
+        groups = {f'{ticker}-{country}': grp.reset_index(drop=True)
+                  for (ticker, country), grp in df.groupby(['ticker', 'country'], sort=False)}
+        return {f'{ticker}-{country}': groups.get(f'{ticker}-{country}', df.iloc[0:0])
+                for ticker, country in symbols}
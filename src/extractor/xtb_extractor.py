@@ -1,17 +1,51 @@
 from typing import Union
-import re
+import asyncio
 
 import src.xtb.xAPIConnector as xtbWrapper
+import src.xtb.xAPIAsyncConnector as xtbAsyncWrapper
+from src.xtb.symbol_catalog import SymbolCatalog, CatalogDiff
+from src.xtb.session_pool import XtbSessionPool
 from .data_extractor import DataExtractor
 
 
 class XtbExtractor(DataExtractor):
-    def __init__(self, auto_login=False):
+    def __init__(self,
+                 auto_login=False,
+                 use_async=False,
+                 catalog: Union[SymbolCatalog, None] = None,
+                 use_pool=False):
+        """
+        XtbExtractor class constructor.
+
+        :param use_async: if True, the asyncio client is used and the commands of execute_many are pipelined
+        on one session instead of waiting for every reply before sending the next command.
+        :param catalog: symbol catalog used by get_symbols and get_names. Defaults to the on-disk catalog
+        (XTB_CATALOG_PATH), getAllSymbols is only queried when it is older than XTB_CATALOG_MAX_AGE.
+        :param use_pool: if True, a session is opened for every configured account (primary and secondary)
+        and the commands are spread over them. A dropped session fails over to the remaining ones.
+        It cannot be combined with use_async.
+
+        The synchronous sessions are kept alive with pings and reconnected automatically when they drop.
+        """
+        if use_async and use_pool:
+            raise ValueError("Error, use_async and use_pool can't be combined. Pass only one of them.")
         super().__init__()
 
-        self.xtb_client = xtbWrapper.APIClient()
+        self._use_async = use_async
+        if self._use_async:
+            self._pool = None
+            self._loop = asyncio.new_event_loop()
+            self.xtb_client = xtbAsyncWrapper.AsyncAPIClient()
+            self._loop.run_until_complete(self.xtb_client.connect())
+        else:
+            # Without use_pool the pool holds the one managed session of the primary account
+            self._pool = XtbSessionPool(self._get_accounts(all_accounts=use_pool))
+            self._loop = None
+            self.xtb_client = None
         self.xtb_session_id = None
         self._raw_data: Union[list, None] = None
+        self._catalog = catalog if catalog is not None else SymbolCatalog()
+        self._catalog_diff: Union[CatalogDiff, None] = None
 
         if auto_login:
             self.connect()
@@ -20,11 +54,67 @@ class XtbExtractor(DataExtractor):
     def raw_data(self):
         return self._raw_data
 
+    @property
+    def catalog_diff(self):
+        """Changes of the catalog made by the last refresh, None if the catalog was not refreshed"""
+        return self._catalog_diff
+
+    @property
+    def pool(self):
+        return self._pool
+
+    def _get_accounts(self, all_accounts: bool = True) -> list:
+        accounts = [(self.credentials['primary_user'], self.credentials['xtb'])]
+        if all_accounts and self.credentials.get('second_user') and self.credentials.get('xtb_secondary'):
+            accounts.append((self.credentials['second_user'], self.credentials['xtb_secondary']))
+        return accounts
+
+    def _execute(self, command: dict) -> dict:
+        if self._use_async:
+            return self._loop.run_until_complete(self.xtb_client.execute(command))
+        return self._pool.execute(command)
+
+    def _command_execute(self, command_name: str, arguments: Union[dict, None] = None) -> dict:
+        return self._execute(xtbWrapper.baseCommand(command_name, arguments))
+
+    def execute_many(self, commands: list) -> list:
+        """
+        Execute many commands on the session.
+
+        :param commands: list of (command name, arguments) tuples.
+        :return: list of the responses in the order of the commands. Failed commands are returned as exceptions.
+        """
+        if self._use_async:
+            async def execute_all():
+                return await asyncio.gather(*[self.xtb_client.commandExecute(name, arguments)
+                                              for name, arguments in commands], return_exceptions=True)
+            return self._loop.run_until_complete(execute_all())
+        return self._pool.execute_many(commands)
+
+    def get_symbols_details(self, symbols: list) -> dict:
+        """
+        Get the details of the passed XTB symbols (e.g. 'AAPL.US_9') with one getSymbol command per symbol.
+
+        :return: Python dict {symbol: returnData}. Symbols that could not be retrieved are skipped.
+        """
+        responses = self.execute_many([('getSymbol', dict(symbol=symbol)) for symbol in symbols])
+        results = dict()
+        for symbol, resp in zip(symbols, responses):
+            if isinstance(resp, Exception) or not resp.get('status'):
+                reason = resp if isinstance(resp, Exception) else resp.get('errorDescr', resp.get('errorCode'))
+                print(f'Could not get details of {symbol}. Reason: {reason}')
+                continue
+            results[symbol] = resp['returnData']
+        return results
+
     def connect(self):
+        if not self._use_async:
+            self._pool.connect()
+            self.xtb_session_id = self._pool.stream_session_id
+            return
+
         try:
-            resp = self.xtb_client.execute(xtbWrapper.loginCommand(self.credentials['primary_user'],
-                                                                   self.credentials['xtb'])
-                                           )
+            resp = self._execute(xtbWrapper.loginCommand(self.credentials['primary_user'], self.credentials['xtb']))
             if not resp['status']:
                 raise ConnectionError(f"Could not establish connection with XTB. Reason: {resp['errorCode']}")
 
@@ -33,22 +123,20 @@ class XtbExtractor(DataExtractor):
             raise ConnectionError(f'Could not establish connection with XTB. Reason: {e}')
 
     def disconnect(self):
-        resp = self.xtb_client.commandExecute('logout')
-        if resp['status']:
+        if not self._use_async:
+            self._pool.disconnect()
             print(f'Successfully logged-out from XTB API!')
+            return
 
-    @staticmethod
-    def __filter_categories(data: list,
-                            category: str):
-        unique_cat = set([elem['categoryName'] for elem in data])
-        if category not in unique_cat:
-            raise ValueError(f"Error, {', '.join(unique_cat)} are valid categories. {category} passed.")
-        data = [elem for elem in data if elem['categoryName'] == category]
-        return data
+        resp = self._command_execute('logout')
+        if resp['status']:
+            print(f'Successfully logged-out from XTB API!')
+        self._loop.run_until_complete(self.xtb_client.disconnect())
+        self._loop.close()
 
     def _get_raw_symbols(self) -> list:
         try:
-            resp = self.xtb_client.commandExecute('getAllSymbols')
+            resp = self._command_execute('getAllSymbols')
         except Exception as e:
             raise BrokenPipeError(f'Could not retrieve data from XTB API. Reason: {e}')
         else:
@@ -64,54 +152,17 @@ class XtbExtractor(DataExtractor):
         names = self.get_names(category)
         return symbols, names
 
+    def get_catalog(self, refresh: bool = False) -> SymbolCatalog:
+        """Return the symbol catalog, refreshed from getAllSymbols if it is stale or refresh is True"""
+        if refresh or not self._catalog.fresh:
+            self._catalog_diff = self._catalog.refresh(self._get_raw_symbols())
+        return self._catalog
+
     def get_symbols(self,
                     category: str = None,
                     include_cfd: bool = False,
-                    group_by_country: bool = True) -> dict:
-
-        data = self._raw_data if self._raw_data is not None else self._get_raw_symbols()
-
-        if category is not None:
-            data = self.__filter_categories(data, category)
-
-        if not include_cfd:
-            data = [elem for elem in data if 'CFD' not in elem['description']]
-
-        data = [
-            {'symbol':
-                 re.sub('\..*$', '', elem['symbol']),
-             'country':
-                 re.sub('\_.*$', '', elem['symbol'].split('.')[1])
-             }
-            for elem in data
-        ]
-
-        if group_by_country:
-            countries = set([elem['country'] for elem in data])
-            data = {country: list(set([elem['symbol'] for elem in data if elem['country'] == country]))
-                    for country in countries
-                    }
-
-        return data
-
-    def get_names(self, category: str = None):
-
-        data = self._raw_data if self._raw_data is not None else self._get_raw_symbols()
-
-        if category is not None:
-            data = self.__filter_categories(data, category)
-
-        data = [elem for elem in data if 'CFD' not in elem['description']]
-
-        data = [
-            {'symbol':
-                 re.sub('\..*$', '', elem['symbol']),
-             'country':
-                 re.sub('\_.*$', '', elem['symbol'].split('.')[1]),
-             'name':
-                 re.sub(r'\([^)]*\)', '', elem['description']).strip()
-             }
-            for elem in data
-        ]
-        return data
+                    group_by_country: bool = True) -> Union[dict, list]:
+        return self.get_catalog().symbols(category, include_cfd, group_by_country)
 
+    def get_names(self, category: str = None) -> list:
+        return self.get_catalog().names(category)
@@ -0,0 +1,91 @@
+from typing import Union
+import time
+
+from src.config.variables import XTB_HISTORY_YEARS, XTB_HISTORY_BATCH_SIZE
+from src.utils.auxiliary import grouper
+from src.xtb.ohlcv_store import OhlcvStore
+from .data_extractor import DataExtractor
+from .xtb_extractor import XtbExtractor
+
+# Chart period of the daily candles (in minutes)
+PERIOD_D1 = 1440
+
+
+class XtbPriceExtractor(DataExtractor):
+    def __init__(self,
+                 auto_login=False,
+                 xtb: Union[XtbExtractor, None] = None,
+                 store: Union[OhlcvStore, None] = None,
+                 history_years: int = XTB_HISTORY_YEARS,
+                 batch_size: int = XTB_HISTORY_BATCH_SIZE):
+        """
+        Extractor of the daily price history of the XTB symbols.
+
+        The candles are fetched with getChartRangeRequest through the sessions of an XtbExtractor, by default
+        a pool of all configured accounts, so the requests run concurrently while every connection keeps
+        the minimum gap between its commands. Only the range after the last stored candle of every symbol
+        is requested and appended to the OhlcvStore.
+
+        :param xtb: XtbExtractor whose sessions are used, an XtbExtractor with use_pool=True by default.
+        :param store: store of the candles, the on-disk store under XTB_PRICES_PATH by default.
+        :param history_years: number of years fetched for symbols that are not in the store yet.
+        :param batch_size: number of symbols requested at once, every batch is stored before the next one.
+        """
+        super().__init__()
+
+        self._xtb = xtb if xtb is not None else XtbExtractor(use_pool=True)
+        self._store = store if store is not None else OhlcvStore()
+        self._history_years = history_years
+        self._batch_size = batch_size
+
+        if auto_login:
+            self.connect()
+
+    @property
+    def store(self) -> OhlcvStore:
+        return self._store
+
+    def connect(self):
+        self._xtb.connect()
+
+    def disconnect(self):
+        self._xtb.disconnect()
+
+    def _range_command(self, symbol: str, end: int) -> tuple:
+        start = self._store.last_ctm(symbol)
+        if start is None:
+            start = end - int(self._history_years * 365.25 * 86400 * 1000)
+        return 'getChartRangeRequest', {'info': dict(symbol=symbol, period=PERIOD_D1, start=start, end=end, ticks=0)}
+
+    def get_data(self, category: str = 'STC', symbols: Union[list, None] = None) -> dict:
+        """
+        Update the stored daily candles of the symbols.
+
+        :param category: XTB category of the symbols taken from the symbol catalog, stocks by default.
+        :param symbols: full XTB symbols (e.g. 'AAPL.US_9') to update instead of the whole category.
+        :return: Python dict with the number of symbols, updated symbols, added candles and the failed symbols.
+        """
+        if symbols is None:
+            symbols = self._xtb.get_catalog().xtb_symbols(category)
+
+        start_time = time.perf_counter()
+        end = int(time.time() * 1000)
+        summary = dict(symbols=len(symbols), updated=0, candles=0, failed=list())
+        for batch in grouper(symbols, self._batch_size):
+            batch = [symbol for symbol in batch if symbol is not None]
+            responses = self._xtb.execute_many([self._range_command(symbol, end) for symbol in batch])
+            for symbol, resp in zip(batch, responses):
+                if isinstance(resp, Exception) or not resp.get('status'):
+                    reason = resp if isinstance(resp, Exception) else resp.get('errorDescr', resp.get('errorCode'))
+                    print(f'Could not get price history of {symbol}. Reason: {reason}')
+                    summary['failed'].append(symbol)
+                    continue
+                added = self._store.append(symbol, resp['returnData'])
+                summary['updated'] += bool(added)
+                summary['candles'] += added
+            print(f"Progress: {summary['updated']} updated, {len(summary['failed'])} failed "
+                  f"of {len(symbols)} symbols.")
+
+        print(f"Price history of {len(symbols)} symbols updated in {time.perf_counter() - start_time:.1f}s: "
+              f"{summary['candles']} new candles, {len(summary['failed'])} failed symbols.")
+        return summary
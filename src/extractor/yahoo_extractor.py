@@ -1,21 +1,50 @@
 # TODO Stop using filter_existing_tickers when Yahoo Transformer would be updated
-from typing import Union
+from typing import Union, Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 from yahoofinancials import YahooFinancials
+from yahoofinancials.data import ManagedException
 import re
+import requests
 
 from src.config.variables import *
 from src.extractor.data_extractor import DataExtractor
 from src.extractor.db_extractor import DbExtractor
 from src.loader.db_loader import DbLoader
+from src.utils.rate_limiter import TokenBucket
+from src.utils.response_cache import ResponseCache
+from src.utils.erroneous_registry import ErroneousRegistry
 
 
 class YahooExtractor(DataExtractor):
-    def __init__(self, grouped_symbols: dict):
+    def __init__(self,
+                 grouped_symbols: dict,
+                 rate_limiter: Union[TokenBucket, None] = None,
+                 cache: Union[ResponseCache, None] = None,
+                 incremental: bool = False,
+                 erroneous_registry: Union[ErroneousRegistry, None] = None,
+                 loaded_symbols: Union[set, None] = None,
+                 watermarks: Union[dict, None] = None):
         """
         YahooExtractor class constructor.
 
         :param grouped_symbols: Python dict containing all symbols necessary to be queried from Yahoo Finance.
         It should have the following structure: {country_code: ['symbol 1', 'symbol 2', etc.]}
+        :param rate_limiter: if passed, the tickers are queried concurrently by up to rate_limiter.max_in_flight
+        threads and the request rate is governed by the limiter, one token per HTTP request (get_data sends one per
+        dataset of a ticker). Otherwise, the tickers are queried one by one.
+        :param cache: if passed, get_data serves the datasets from the cache while they are within their time to live
+        and only queries Yahoo Finance for the missing ones.
+        :param incremental: if True, symbols that are already loaded are extracted again once their next fiscal
+        year-end plus STATEMENT_REPORTING_LAG_DAYS has passed. The statements of those symbols are always queried
+        from Yahoo Finance, bypassing the cache. The watermarks used for that are available in the watermarks
+        property, so that only newer rows can be loaded.
+        :param erroneous_registry: registry of the erroneous symbols. If passed, the caller is responsible
+        for flushing it, otherwise a new registry is created and flushed at the end of get_data.
+        :param loaded_symbols: optional set of already loaded (ticker, country) pairs, e.g. computed once for
+        the whole universe by DbExtractor.get_loaded_symbols. If None, the database is queried for the grouped symbols.
+        :param watermarks: optional watermarks of the incremental mode as returned by DbExtractor.get_watermarks,
+        e.g. queried once for many extractors. If None, they are queried by filter_tickers.
 
         Example:
         grouped_symbols = {'US': ['AAPL', 'GOOG'], 'CH': ['CFR']}
@@ -23,10 +52,21 @@ class YahooExtractor(DataExtractor):
         super().__init__()
 
         self._grouped_symbols: dict = grouped_symbols
-        self._yf: Union[YahooFinancials, None] = None
+        self._rate_limiter = rate_limiter
+        self._cache = cache
+        self._incremental = incremental
+        self._watermarks: dict = watermarks if watermarks is not None else dict()
+        self._own_watermarks = watermarks is None
+        self._loaded_symbols = loaded_symbols
+        # Yahoo tickers whose cached statements are not used, as new statements are due
+        self._refresh_statements: set = set()
+        # (ticker, country): error of the symbols whose requests failed on the network or with an HTTP error
+        self._transport_errors: dict = dict()
         self._db_extr = DbExtractor(auto_login=True)
         self._db_load = DbLoader(auto_login=True)
-        self._erroneous_tickers: list = self._db_extr.get_erroneous()
+        self._own_registry = erroneous_registry is None
+        self._erroneous = erroneous_registry if erroneous_registry is not None \
+            else ErroneousRegistry(self._db_load)
 
     @property
     def grouped_symbols(self):
@@ -38,46 +78,262 @@ class YahooExtractor(DataExtractor):
 
     @property
     def erroneous_tickers(self):
-        return self._erroneous_tickers
+        return self._erroneous.tickers
+
+    @property
+    def erroneous_registry(self):
+        return self._erroneous
+
+    @property
+    def watermarks(self):
+        return self._watermarks
+
+    @property
+    def transport_errors(self) -> dict:
+        return self._transport_errors
 
     def connect(self):
         pass
 
     def __handle_error(self, company, country, error) -> None:
         comp = re.sub('\..*$', '', company)
-        if comp not in self._erroneous_tickers:
-            self._db_load.load_erroneous(comp, country, error)
-            self._erroneous_tickers = self._db_extr.get_erroneous()
+        self._erroneous.add(comp, country, error)
         print(f'Could not get data for {comp}-{country}. Reason: {error}...')
 
-    def get_data(self):
+    @staticmethod
+    def _is_transport_error(error: Exception) -> bool:
+        # Timeouts, lost connections and HTTP errors other than 404 say nothing about the data of the symbol
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code != 404
+        if isinstance(error, (requests.RequestException, OSError)):
+            return True
+        status = re.search(r'HTTP (\d{3})', str(error)) if isinstance(error, ManagedException) else None
+        return status is not None and status.group(1) != '404'
+
+    @staticmethod
+    def _try_fetch(fetch: Callable, company: str) -> tuple:
+        try:
+            return fetch(company), None
+        except Exception as e:
+            return None, e
+
+    def _fetch_all(self,
+                   fetch: Callable,
+                   fetch_many: Union[Callable, None] = None,
+                   tokens: int = 1) -> list:
+        """
+        Run the fetch function for every grouped symbol.
+
+        The requests are sent sequentially or, if a rate limiter was passed, concurrently within the limiter bounds.
+        Errors are handled in the calling thread once all requests are finished. Symbols failing on a transport
+        error are kept in transport_errors instead of the erroneous registry, so that they are fetched again later.
+
+        :param fetch: function that takes a Yahoo Finance ticker and returns the queried data.
+        :param fetch_many: optional function that takes a list of tickers and returns {ticker: data or exception}.
+        It is used per country in the sequential mode. If it fails as a whole, every ticker is fetched separately.
+        :param tokens: rate limiter tokens taken per call of fetch, i.e. the number of requests it sends.
+        0 if fetch takes the tokens of its requests itself.
+        :return: list of (country, company, data) tuples of all successful requests.
+        """
+        tasks = [(country, comp) for country, companies in self._grouped_symbols.items() for comp in companies]
+
+        if self._rate_limiter is None:
+            fetched = dict()
+            if fetch_many is not None:
+                for country, companies in self._grouped_symbols.items():
+                    if not companies:
+                        continue
+                    data, error = self._try_fetch(fetch_many, companies)
+                    if error is None:
+                        fetched.update({(country, comp): (None, result) if isinstance(result, Exception)
+                                        else (result, None) for comp, result in data.items()})
+            outcomes = [fetched[task] if task in fetched else self._try_fetch(fetch, task[1]) for task in tasks]
+        else:
+            def limited_fetch(company):
+                self._rate_limiter.acquire(tokens)
+                try:
+                    return self._try_fetch(fetch, company)
+                finally:
+                    self._rate_limiter.release()
+
+            with ThreadPoolExecutor(max_workers=self._rate_limiter.max_in_flight) as executor:
+                outcomes = list(executor.map(limited_fetch, [comp for country, comp in tasks]))
+
+        results = list()
+        for (country, comp), (data, error) in zip(tasks, outcomes):
+            if error is not None and self._is_transport_error(error):
+                self._transport_errors[(re.sub('\..*$', '', comp), country)] = str(error)
+                print(f'Could not reach Yahoo Finance for {comp}-{country}. Reason: {error}...')
+                continue
+            if error is not None:
+                self.__handle_error(comp, country, str(error))
+                continue
+            results.append((country, comp, data))
+        return results
+
+    def get_data(self, frequency: str = 'annual') -> dict:
+        """
+        Extract all five datasets (balance, income, cash, stats and profile) of the grouped symbols.
+
+        Every ticker is queried with a single YahooFinancials client, so the datasets share its underlying responses.
+        In the sequential mode the tickers of a country are passed to YahooFinancials as one list.
+        """
         self.filter_tickers()
         self.preprocess_tickers()
-        results: dict = {'balance': self.get_financial_data('balance'),
-                         'income': self.get_financial_data('income'),
-                         'cash': self.get_financial_data('cash'),
-                         'stats': self.get_company_statistics('stats'),
-                         'profile': self.get_company_statistics('profile'),
-                         }
+
+        def fetch_one(company):
+            data = self._fetch_cached([company], frequency)[company]
+            if isinstance(data, Exception):
+                raise data
+            return data
+
+        results: dict = {data_type: dict() for data_type in COMPANY_DATA_TYPES}
+        # The tokens are taken per dataset requested from Yahoo Finance, datasets served by the cache are free
+        for country, comp, data in self._fetch_all(fetch_one, lambda comps: self._fetch_cached(comps, frequency),
+                                                   tokens=0):
+            ticker = re.sub('\..*$', '', comp)
+            symbol = f'{ticker}-{country}'
+            for data_type, values in data.items():
+                results[data_type][symbol] = values if data_type in STATEMENT_TYPES else [values]
+
+        if self._own_registry:
+            self._erroneous.flush()
         return results
 
+    def _fetch_cached(self,
+                      companies: list,
+                      frequency: str = 'annual') -> dict:
+        """fetch_company_data counterpart that serves the datasets available in the cache without any request"""
+        if self._cache is None:
+            return self._request_company_data(companies, frequency)
+
+        missing = object()
+
+        def lookup(comp: str, data_type: str):
+            if data_type in STATEMENT_TYPES and comp in self._refresh_statements:
+                return missing
+            return self._cache.get(comp, data_type, frequency, default=missing)
+
+        cached = {comp: {data_type: lookup(comp, data_type) for data_type in COMPANY_DATA_TYPES}
+                  for comp in companies}
+        cached = {comp: {data_type: data for data_type, data in datasets.items() if data is not missing}
+                  for comp, datasets in cached.items()}
+
+        to_fetch = [comp for comp in companies if len(cached[comp]) < len(COMPANY_DATA_TYPES)]
+        data_types = [data_type for data_type in COMPANY_DATA_TYPES
+                      if any(data_type not in cached[comp] for comp in to_fetch)]
+        fetched = self._request_company_data(to_fetch, frequency, data_types) if to_fetch else dict()
+
+        results = dict()
+        for comp in companies:
+            if isinstance(fetched.get(comp), Exception):
+                results[comp] = fetched[comp]
+                continue
+            for data_type, data in fetched.get(comp, dict()).items():
+                if data_type not in cached[comp]:
+                    self._cache.set(comp, data_type, frequency, data)
+                    cached[comp][data_type] = data
+            results[comp] = cached[comp]
+        return results
+
+    def _request_company_data(self,
+                              companies: list,
+                              frequency: str = 'annual',
+                              data_types: Union[list, tuple] = COMPANY_DATA_TYPES) -> dict:
+        # YahooFinancials sends one request per ticker and dataset
+        if self._rate_limiter is not None:
+            self._rate_limiter.take(len(companies) * len(data_types))
+        return self.fetch_company_data(companies, frequency, data_types)
+
+    @staticmethod
+    def fetch_company_data(companies: list,
+                           frequency: str = 'annual',
+                           data_types: Union[list, tuple] = COMPANY_DATA_TYPES) -> dict:
+        """
+        Query the financial statements, statistics and profile of the passed tickers with one YahooFinancials client.
+
+        :param companies: list of Yahoo Finance tickers.
+        :param frequency: frequency of the financial statement data, 'annual' or 'quarterly'.
+        :param data_types: datasets to query, all five by default.
+        :return: Python dict {ticker: {'balance': [...], 'income': [...], 'cash': [...], 'stats': {...},
+        'profile': {...}}}. Datasets not returned by Yahoo Finance are left out, tickers without any dataset
+        are mapped to a LookupError.
+        """
+        yf = YahooFinancials(companies if len(companies) > 1 else companies[0])
+
+        datasets = dict()
+        stmt_types = [data_type for data_type in data_types if data_type in STATEMENT_TYPES]
+        if stmt_types:
+            report_num = yf.get_report_type(frequency)
+            stmts = yf.get_financial_stmts(frequency, stmt_types)
+            datasets.update({stmt_type: stmts.get(yf.YAHOO_FINANCIAL_TYPES[stmt_type][report_num]) or dict()
+                             for stmt_type in stmt_types})
+        if 'stats' in data_types:
+            datasets['stats'] = yf.get_summary_data() or dict()
+        if 'profile' in data_types:
+            datasets['profile'] = yf.get_stock_profile_data() or dict()
+
+        results = dict()
+        for comp in companies:
+            # Many small caps and ETFs lack some datasets, the transformer loads the available ones
+            results[comp] = {data_type: data[comp] for data_type, data in datasets.items() if comp in data}
+            if not results[comp]:
+                results[comp] = LookupError('No data returned')
+        return results
+
+    @staticmethod
+    def _yahoo_ticker(comp: str, country: str) -> str:
+        return comp + f'.{TICKER_SUFFIXES[country]}' if country in TICKER_SUFFIXES else comp
+
     def preprocess_tickers(self):
         """Pre-processes tickers to make the searchable in Yahoo Finance"""
         for country, companies in self._grouped_symbols.items():
             if country not in TICKER_SUFFIXES.keys():
                 continue
-            new_comps = [comp + f'.{TICKER_SUFFIXES[country]}' for comp in companies]
+            new_comps = [self._yahoo_ticker(comp, country) for comp in companies]
             self._grouped_symbols[country] = new_comps
 
     def filter_tickers(self):
-        """Filters out all tickers that are already present in the statement tables"""
-        existing_tickers = self._db_extr.get_all_tickers()
+        """
+        Filters out all tickers that are already present in the statement tables.
+
+        In the incremental mode the loaded tickers are kept if new annual statements are due.
+        """
+        if self._incremental:
+            self._filter_due_tickers()
+            return
+
+        loaded = self._loaded_symbols
+        if loaded is None:
+            loaded = self._db_extr.get_loaded_symbols([(comp, country) for country, companies
+                                                       in self._grouped_symbols.items() for comp in companies])
 
         for country, companies in self._grouped_symbols.items():
-            comps = [comp for comp in companies if comp not in existing_tickers]  # Filter existing
-            comps = [comp for comp in comps if comp not in self._erroneous_tickers] # Filter erroneous
+            comps = [comp for comp in companies if (comp, country) not in loaded]  # Filter existing
+            comps = [comp for comp in comps if (comp, country) not in self._erroneous]  # Filter erroneous
             self.grouped_symbols[country] = comps
 
+    def _filter_due_tickers(self):
+        """Keep the tickers that are not fully loaded or whose next fiscal year-end plus reporting lag has passed"""
+        if self._own_watermarks:
+            self._watermarks = self._db_extr.get_watermarks(COMPANY_DATA_TYPES)
+        today = date.today()
+
+        def is_due(ticker: str, country: str) -> bool:
+            marks = self._watermarks.get((ticker, country), dict())
+            if any(marks.get(stmt_type) is None for stmt_type in STATEMENT_TYPES):
+                return True
+            oldest = min(marks[stmt_type] for stmt_type in STATEMENT_TYPES)
+            if oldest + timedelta(days=365 + STATEMENT_REPORTING_LAG_DAYS) > today:
+                return False
+            # Cached statements of a loaded symbol predate the statements that are due
+            self._refresh_statements.add(self._yahoo_ticker(ticker, country))
+            return True
+
+        for country, companies in self._grouped_symbols.items():
+            comps = [comp for comp in companies if (comp, country) not in self._erroneous]
+            self.grouped_symbols[country] = [comp for comp in comps if is_due(comp, country)]
+
     # noinspection PyMethodOverriding
     def get_financial_data(self,
                            statement_type: str,
@@ -101,17 +357,12 @@ class YahooExtractor(DataExtractor):
             stmt[f'{comp}-{country}'] = stmt.pop(comp)
             return stmt
 
+        def fetch(company):
+            return YahooFinancials(company).get_financial_stmts(frequency, statement_type)
+
         results = dict()
-        for country, companies in self._grouped_symbols.items():
-            for comp in companies:
-                try:
-                    self._yf = YahooFinancials(comp)
-                    stmt = self._yf.get_financial_stmts(frequency, statement_type)
-                except Exception as e:
-                    self.__handle_error(comp, country, str(e))
-                    continue
-                else:
-                    results.update(pre_process_statement(stmt, country, comp))
+        for country, comp, stmt in self._fetch_all(fetch):
+            results.update(pre_process_statement(stmt, country, comp))
         return results
 
     def get_company_statistics(self, statement_type: str) -> dict:
@@ -121,21 +372,16 @@ class YahooExtractor(DataExtractor):
             stmt[f'{comp}-{country}'] = stmt.pop(comp)
             return stmt
 
+        def fetch(company):
+            if statement_type == 'stats':
+                return YahooFinancials(company).get_summary_data()
+            return YahooFinancials(company).get_stock_profile_data()
+
+        if statement_type not in ('stats', 'profile'):
+            raise ValueError(f"Unrecognized statement type. 'stats' or 'profile' accepted. "
+                             f"{statement_type} passed")
+
         results = dict()
-        for country, companies in self._grouped_symbols.items():
-            for comp in companies:
-                try:
-                    self._yf = YahooFinancials(comp)
-                    if statement_type == 'stats':
-                        stmt = self._yf.get_summary_data()
-                    elif statement_type == 'profile':
-                        stmt = self._yf.get_stock_profile_data()
-                    else:
-                        raise ValueError(f"Unrecognized statement type. 'stats' or 'profile' accepted. "
-                                         f"{statement_type} passed")
-                except Exception as e:
-                    self.__handle_error(comp, country, str(e))
-                    continue
-                else:
-                    results.update(pre_process_stats(stmt, country, comp))
-            return results
+        for country, comp, stmt in self._fetch_all(fetch):
+            results.update(pre_process_stats(stmt, country, comp))
+        return results
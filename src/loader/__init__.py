@@ -1 +1,2 @@
 from .db_loader import DbLoader
+from .tick_writer import TickWriter
@@ -1,15 +1,21 @@
-from sqlalchemy import MetaData
+from typing import Union
+from sqlalchemy import Date, tuple_, and_, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
 import pandas as pd
 
-from src.database.database import engine
+from src.config.variables import DB_MAX_BIND_PARAMS
+from src.database.context import DbContext, get_db_context
 from src.database.models import balance_sheet, profit_loss_statement, cashflow_statement, \
     stock_statistics, country_mapping, stock_profile, erroneous_symbols
 
+# Database URLs whose tables were already prepared for loading by this process
+_prepared_databases: set = set()
+
 
 class DbLoader:
-    def __init__(self, auto_login=False):
-        self._db_engine = engine
-        self._conn = None
+    def __init__(self, auto_login=False, db_context: Union[DbContext, None] = None):
+        self._db_context = db_context if db_context is not None else get_db_context()
+        self._db_engine = self._db_context.engine
         self._balance_tbl = balance_sheet.BalanceSheet
         self._income_tbl = profit_loss_statement.ProfitLossStmt
         self._cashflow_tbl = cashflow_statement.CashFlowStmt
@@ -18,30 +24,35 @@ class DbLoader:
         self._country_mapping = country_mapping.CountryMapping
         self._erroneous_symbols = erroneous_symbols.ErroneousSymbols
 
-        self._metadata = MetaData()
-        self._metadata.reflect(bind=self._db_engine)
+        self._metadata = self._db_context.metadata
 
         if auto_login:
             self.connect()
 
     def connect(self):
-        self._conn = engine.connect()
+        """Every write checks out its own connection of the engine pool, so there is nothing to open"""
+        pass
 
     def disconnect(self):
-        self._conn.close()
-        self._db_engine.dispose()
+        """The connections are returned to the engine pool after every write, use DbContext.dispose to close them"""
+        pass
 
-    def _get_tablename(self, name: str):
+    def _get_model(self, name: str):
         if name == 'balance':
-            return self._balance_tbl.__tablename__
+            return self._balance_tbl
         elif name == 'income':
-            return self._income_tbl.__tablename__
+            return self._income_tbl
         elif name == 'cash':
-            return self._cashflow_tbl.__tablename__
+            return self._cashflow_tbl
         elif name == 'stats':
-            return self._stock_stats.__tablename__
+            return self._stock_stats
         elif name == 'profile':
-            return self._stock_profile.__tablename__
+            return self._stock_profile
+
+    def _get_tablename(self, name: str):
+        model = self._get_model(name)
+        if model is not None:
+            return model.__tablename__
 
     def append_data(self, name: str, data: pd.DataFrame) -> None:
         data.to_sql(name,
@@ -50,21 +61,19 @@ class DbLoader:
                     index=False)
 
     def load_erroneous(self, ticker: str, country: str, error: str) -> None:
+        self.load_erroneous_bulk([{'ticker': ticker, 'country': country, 'reason': error}])
+
+    def load_erroneous_bulk(self, data: list) -> None:
+        """Load many erroneous symbols at once, data is a list of {'ticker', 'country', 'reason'} dicts"""
         name = self._erroneous_symbols.__tablename__
-        data = [
-            {'ticker': ticker, 'country': country, 'reason': error}
-        ]
-        df = pd.DataFrame(data)
+        df = pd.DataFrame(data, columns=['ticker', 'country', 'reason'])
         self.append_data(name, df)
 
     def delete_contents(self, tablename: str):
-        names = self._db_engine.table_names()
-        if tablename not in names:
-            raise ValueError(f'{tablename} was not found in the database.')
-
-        tbl = [tbl for tbl in list(self._metadata.tables.values()) if tbl.fullname == tablename][0]
+        tbl = self._db_context.get_table(tablename)
         delete_stmt = tbl.delete()
-        self._conn.execute(delete_stmt)
+        with self._db_engine.begin() as conn:
+            conn.execute(delete_stmt)
 
     def load_country_mapping(self, mapping: pd.DataFrame):
         name = self._country_mapping.__tablename__
@@ -75,7 +84,137 @@ class DbLoader:
                        if_exists='append',
                        index=False)
 
+    def _add_missing_columns(self, tbl) -> bool:
+        """Add the model columns missing in the database table, e.g. columns added to the model later on"""
+        stored = self._db_context.get_table(tbl.name)
+        missing = [col for col in tbl.columns if col.name not in stored.columns]
+        if not missing:
+            return False
+
+        dialect = self._db_engine.dialect
+        quote = dialect.identifier_preparer.quote
+        with self._db_engine.begin() as conn:
+            for col in missing:
+                conn.exec_driver_sql(f'ALTER TABLE {quote(tbl.name)} '
+                                     f'ADD COLUMN {quote(col.name)} {col.type.compile(dialect=dialect)}')
+        print(f"Added the columns {', '.join(col.name for col in missing)} to {tbl.name}.")
+        return True
+
+    def prepare_tables(self) -> None:
+        """
+        Bring the tables loaded by upsert_statements up to date with the models: the missing columns and indexes
+        are added. It runs once per process and database, tables that do not exist yet are skipped.
+        """
+        url = str(self._db_engine.url)
+        if url in _prepared_databases:
+            return
+        altered = False
+        for model in (self._balance_tbl, self._income_tbl, self._cashflow_tbl, self._stock_stats,
+                      self._stock_profile):
+            tbl = model.__table__
+            if tbl.name not in self._db_context.tables:
+                continue
+            altered |= self._add_missing_columns(tbl)
+            for index in tbl.indexes:
+                index.create(self._db_engine, checkfirst=True)
+        if altered:
+            self._db_context.reflect()
+        _prepared_databases.add(url)
+
     def load_statements(self, statements: dict):
         for stmt_type, data in statements.items():
             name = self._get_tablename(stmt_type)
             self.append_data(name, data)
+
+    @staticmethod
+    def _to_records(tbl, data: pd.DataFrame) -> list:
+        """Change the DataFrame into a list of dicts with the table's column types (NaN as None, dates as date)"""
+        cols = [col for col in data.columns if col in tbl.columns]
+        data = data[cols].copy()
+        for col in cols:
+            if isinstance(tbl.columns[col].type, Date):
+                data[col] = pd.to_datetime(data[col]).dt.date
+        data = data.astype(object).where(data.notna(), None)
+        return data.to_dict('records')
+
+    @staticmethod
+    def _execute_upsert(conn, tbl, inserted: list, updated: list, primary_key: list) -> None:
+        """
+        Write the records with multi-row INSERT ... ON CONFLICT DO UPDATE statements on Postgres and SQLite.
+        Other dialects get multi-row INSERTs of the new records and an executemany UPDATE of the changed ones.
+        """
+        dialect = conn.dialect.name
+        records = inserted + updated
+        batch_size = max(DB_MAX_BIND_PARAMS // len(records[0]), 1)
+
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            for i in range(0, len(records), batch_size):
+                stmt = insert(tbl).values(records[i:i + batch_size])
+                update_cols = {col: stmt.excluded[col] for col in records[0] if col not in primary_key}
+                if update_cols:
+                    stmt = stmt.on_conflict_do_update(index_elements=primary_key, set_=update_cols)
+                else:
+                    stmt = stmt.on_conflict_do_nothing(index_elements=primary_key)
+                conn.execute(stmt)
+            return
+
+        for i in range(0, len(inserted), batch_size):
+            conn.execute(tbl.insert().values(inserted[i:i + batch_size]))
+
+        if updated:
+            stmt = tbl.update() \
+                .where(and_(*[tbl.c[col] == bindparam(f'pk_{col}') for col in primary_key])) \
+                .values({col: bindparam(col) for col in updated[0] if col not in primary_key})
+            conn.execute(stmt, [dict(rec, **{f'pk_{col}': rec[col] for col in primary_key}) for rec in updated])
+
+    def upsert_data(self, conn, name: str, data: pd.DataFrame) -> dict:
+        """
+        Insert new rows and update the changed ones of the passed table.
+
+        :param conn: connection used for the whole operation, so it can be a part of a bigger transaction.
+        :param name: one of 'balance', 'income', 'cash', 'stats', 'profile' or a table name.
+        :param data: Pandas DataFrame with the table columns.
+        :return: Python dict with the number of inserted, updated and unchanged rows.
+        """
+        model = self._get_model(name)
+        tbl = model.__table__ if model is not None else self._db_context.get_table(name)
+        primary_key = [col.name for col in tbl.primary_key.columns]
+
+        # Keeping the last row of duplicated keys just like a sequence of single upserts would do
+        records = {tuple(rec[col] for col in primary_key): rec for rec in self._to_records(tbl, data)}
+
+        existing = dict()
+        keys = list(records)
+        chunk_size = max(DB_MAX_BIND_PARAMS // len(primary_key), 1)
+        for i in range(0, len(keys), chunk_size):
+            query = tbl.select().where(tuple_(*[tbl.c[col] for col in primary_key]).in_(keys[i:i + chunk_size]))
+            for row in conn.execute(query):
+                row = dict(row._mapping)
+                existing[tuple(row[col] for col in primary_key)] = row
+
+        inserted = [rec for key, rec in records.items() if key not in existing]
+        updated = [rec for key, rec in records.items()
+                   if key in existing and any(existing[key][col] != val for col, val in rec.items())]
+
+        if inserted or updated:
+            self._execute_upsert(conn, tbl, inserted, updated, primary_key)
+
+        return {'inserted': len(inserted),
+                'updated': len(updated),
+                'unchanged': len(records) - len(inserted) - len(updated)}
+
+    def upsert_statements(self, statements: dict) -> dict:
+        """
+        Upsert all passed statements in a single transaction.
+
+        :param statements: Python dict {'balance': DataFrame, 'income': DataFrame, ...} as returned by
+        YahooTransformer.process_data.
+        :return: Python dict {statement type: {'inserted': n, 'updated': n, 'unchanged': n}}.
+        """
+        self.prepare_tables()
+        results = dict()
+        with self._db_engine.begin() as conn:
+            for stmt_type, data in statements.items():
+                results[stmt_type] = self.upsert_data(conn, stmt_type, data)
+        return results
@@ -0,0 +1,150 @@
+from typing import Union
+import queue
+import threading
+import time
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src.config.variables import XTB_TICK_BATCH_SIZE, XTB_TICK_FLUSH_SECONDS, XTB_TICK_QUEUE_SIZE
+from src.database.context import DbContext, get_db_context
+from src.database.models.tick_prices import TickPrice
+
+_TICK_FIELDS = tuple(col.name for col in TickPrice.__table__.columns)
+
+
+class TickWriter:
+    def __init__(self,
+                 db_context: Union[DbContext, None] = None,
+                 batch_size: int = XTB_TICK_BATCH_SIZE,
+                 flush_seconds: float = XTB_TICK_FLUSH_SECONDS,
+                 max_queue: int = XTB_TICK_QUEUE_SIZE):
+        """
+        Background writer of the streamed XTB ticks.
+
+        on_tick only puts the tick into a bounded in-memory queue, so the stream reader never waits for
+        the database. A writer thread inserts the queued ticks in bulk whenever batch_size ticks are waiting
+        or flush_seconds have passed since the last flush. If the database falls behind and the queue is full,
+        new ticks are dropped and counted instead of blocking the stream.
+
+        Example:
+        writer = TickWriter()
+        writer.start()
+        client = APIStreamClient(ssId=ssid, tickFun=writer.on_tick)
+        ...
+        writer.stop()
+        """
+        self._db_context = db_context if db_context is not None else get_db_context()
+        self._batch_size = batch_size
+        self._flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread: Union[threading.Thread, None] = None
+        self._stopping = threading.Event()
+        self._tbl = TickPrice.__table__
+
+        self._received = 0
+        self._dropped = 0
+        self._written = 0
+        self._failed = 0
+        self._batches = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def received(self) -> int:
+        return self._received
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    @property
+    def failed(self) -> int:
+        return self._failed
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        # The tick table is created on first use
+        self._tbl.create(self._db_context.engine, checkfirst=True)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='tick-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Union[float, None] = None) -> None:
+        """
+        Write the ticks still in the queue and stop the writer thread.
+
+        If the thread does not finish within timeout it keeps writing in the background and stays running.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                print(f'Tick writer did not stop within {timeout} s, {self.queue_depth} ticks are still queued.')
+            else:
+                self._thread = None
+
+    def on_tick(self, msg: dict) -> None:
+        """Queue a tickPrices message of APIStreamClient, can be passed as its tickFun. Never blocks."""
+        data = msg['data']
+        self._received += 1
+        try:
+            self._queue.put_nowait(tuple(data.get(field, 0 if field == 'level' else None) for field in _TICK_FIELDS))
+        except queue.Full:
+            self._dropped += 1
+
+    def _next_batch(self) -> list:
+        batch = list()
+        deadline = time.monotonic() + self._flush_seconds
+        while len(batch) < self._batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+            # Taking everything that is already waiting without going back to the timed wait
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+        return batch
+
+    def _run(self) -> None:
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: list) -> None:
+        records = [dict(zip(_TICK_FIELDS, tick)) for tick in batch]
+        try:
+            with self._db_context.engine.begin() as conn:
+                dialect = conn.dialect.name
+                if dialect in ('postgresql', 'sqlite'):
+                    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+                    stmt = insert(self._tbl).on_conflict_do_nothing(index_elements=['symbol', 'timestamp', 'level'])
+                else:
+                    stmt = self._tbl.insert()
+                conn.execute(stmt, records)
+        except Exception as e:
+            self._failed += len(batch)
+            print(f'Could not write {len(batch)} ticks. Reason: {e}')
+        else:
+            self._written += len(batch)
+            self._batches += 1
+
+    def summary(self) -> str:
+        return f'Tick writer: {self._received} received, {self._written} written in {self._batches} batches, ' \
+               f'{self._dropped} dropped, {self._failed} failed, {self.queue_depth} queued.'
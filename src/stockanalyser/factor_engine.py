@@ -0,0 +1,265 @@
+from typing import Union, Callable
+import numpy as np
+import pandas as pd
+
+
+def _div(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    """Element-wise division, NaN where the denominator is zero or missing"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den != 0, num / den, np.nan)
+
+
+def _positive(values: np.ndarray) -> np.ndarray:
+    return np.where(values > 0, values, np.nan)
+
+
+def _rank(values: np.ndarray, ascending: bool = True) -> np.ndarray:
+    """Rank across the universe (1 = first), missing values are not ranked"""
+    return pd.Series(values).rank(ascending=ascending, method='min').to_numpy()
+
+
+class FactorFrame:
+    def __init__(self, years: pd.DataFrame, stats: pd.DataFrame, intermediates: dict):
+        """
+        Fiscal years of the whole universe lined up side by side, one row per symbol.
+
+        Columns are converted to float arrays and intermediates are evaluated on first use and cached,
+        so every factor sharing them reuses the same arrays.
+
+        :param years: statements unstacked by fiscal year, columns (name, year) with year 0 the last one.
+        :param stats: latest statistics of every symbol aligned with the rows of years.
+        :param intermediates: Python dict {name: function of the FactorFrame}.
+        """
+        self._years = years
+        self._stats = stats
+        self._intermediates = intermediates
+        self._cache: dict = dict()
+
+    @property
+    def index(self) -> pd.Index:
+        return self._years.index
+
+    def __len__(self) -> int:
+        return len(self._years)
+
+    def col(self, name: str, year: int = 0) -> np.ndarray:
+        """Statement column of the fiscal year (0 = last, 1 = prior year, ...), NaN where not reported"""
+        key = (name, year)
+        if key not in self._cache:
+            if key in self._years.columns:
+                self._cache[key] = pd.to_numeric(self._years[key], errors='coerce').to_numpy(dtype=float)
+            else:
+                self._cache[key] = np.full(len(self), np.nan)
+        return self._cache[key]
+
+    def stat(self, name: str) -> np.ndarray:
+        """Latest statistics column (e.g. marketCap), NaN where not available"""
+        key = ('stats', name)
+        if key not in self._cache:
+            if name in self._stats.columns:
+                self._cache[key] = pd.to_numeric(self._stats[name], errors='coerce').to_numpy(dtype=float)
+            else:
+                self._cache[key] = np.full(len(self), np.nan)
+        return self._cache[key]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """Value of the named intermediate, evaluated once"""
+        if name not in self._cache:
+            self._cache[name] = self._intermediates[name](self)
+        return self._cache[name]
+
+    def fiscal_years(self) -> np.ndarray:
+        """Number of fiscal years reported by every symbol"""
+        if 'fiscal_years' not in self._cache:
+            dates = [col for col in self._years.columns if col[0] == 'asof_date']
+            self._cache['fiscal_years'] = self._years[dates].notna().sum(axis=1).to_numpy() if dates \
+                else np.zeros(len(self), dtype=int)
+        return self._cache['fiscal_years']
+
+    def last_asof_date(self) -> np.ndarray:
+        # A frame without statements has no asof_date columns
+        if ('asof_date', 0) not in self._years.columns:
+            return np.full(len(self), None, dtype=object)
+        return self._years[('asof_date', 0)].to_numpy()
+
+
+class Factor:
+    def __init__(self,
+                 name: str,
+                 formula: Callable,
+                 years: int = 1,
+                 ascending: bool = False):
+        """
+        Declarative definition of a factor.
+
+        :param name: name of the output column.
+        :param formula: function of the FactorFrame returning one value per symbol, built from its columns
+        (frame.col, frame.stat) and intermediates (frame['name']) with vectorized operations.
+        :param years: number of fiscal years the factor needs, symbols reporting fewer years get NaN.
+        :param ascending: True if lower values are better, used to sort the output.
+        """
+        self.name = name
+        self.formula = formula
+        self.years = years
+        self.ascending = ascending
+
+    def evaluate(self, frame: FactorFrame) -> np.ndarray:
+        values = np.asarray(self.formula(frame), dtype=float)
+        return np.where(frame.fiscal_years() >= self.years, values, np.nan)
+
+    def __repr__(self) -> str:
+        return f'Factor({self.name}, years={self.years})'
+
+
+# Shared intermediates, suffix _py marks the prior fiscal year
+INTERMEDIATES = {
+    'avg_assets': lambda x: (x.col('totalAssets', 0) + x.col('totalAssets', 1)) / 2,
+    'avg_assets_py': lambda x: (x.col('totalAssets', 1) + x.col('totalAssets', 2)) / 2,
+    'roa': lambda x: _div(x.col('netIncome', 0), x['avg_assets']),
+    'roa_py': lambda x: _div(x.col('netIncome', 1), x['avg_assets_py']),
+    'cfo_to_assets': lambda x: _div(x.col('operatingCashFlow', 0), x.col('totalAssets', 0)),
+    'leverage': lambda x: _div(x.col('longTermDebt', 0), x.col('totalAssets', 0)),
+    'leverage_py': lambda x: _div(x.col('longTermDebt', 1), x.col('totalAssets', 1)),
+    'current_ratio': lambda x: _div(x.col('currentAssets', 0), x.col('currentLiabilities', 0)),
+    'current_ratio_py': lambda x: _div(x.col('currentAssets', 1), x.col('currentLiabilities', 1)),
+    'gross_margin': lambda x: _div(x.col('grossProfit', 0), x.col('totalRevenue', 0)),
+    'gross_margin_py': lambda x: _div(x.col('grossProfit', 1), x.col('totalRevenue', 1)),
+    'asset_turnover': lambda x: _div(x.col('totalRevenue', 0), x['avg_assets']),
+    'asset_turnover_py': lambda x: _div(x.col('totalRevenue', 1), x['avg_assets_py']),
+    'working_capital': lambda x: x.col('currentAssets', 0) - x.col('currentLiabilities', 0),
+    'shares': lambda x: _div(x.stat('marketCap'), x.stat('previousClose')),
+    'eps': lambda x: _div(x.col('netIncome', 0), x['shares']),
+    'book_value_per_share': lambda x: _div(x.col('stockholdersEquity', 0), x['shares']),
+    'enterprise_value': lambda x: x.stat('marketCap') + x.col('totalDebt', 0) - x.col('cashAndCashEquivalents', 0),
+    'graham_number': lambda x: np.sqrt(22.5 * _positive(x['eps']) * _positive(x['book_value_per_share'])),
+    'earnings_yield': lambda x: _div(x.col('ebit', 0), _positive(x['enterprise_value'])),
+    'return_on_capital': lambda x: _div(x.col('ebit', 0), _positive(x['working_capital'] + x.col('netPPE', 0))),
+    # Beneish M-Score indices, last fiscal year against the prior one
+    'receivables_to_sales': lambda x: _div(x.col('accountsReceivable', 0), x.col('totalRevenue', 0)),
+    'receivables_to_sales_py': lambda x: _div(x.col('accountsReceivable', 1), x.col('totalRevenue', 1)),
+    'soft_assets': lambda x: 1 - _div(x.col('currentAssets', 0) + x.col('netPPE', 0), x.col('totalAssets', 0)),
+    'soft_assets_py': lambda x: 1 - _div(x.col('currentAssets', 1) + x.col('netPPE', 1), x.col('totalAssets', 1)),
+    'depreciation_rate': lambda x: _div(x.col('depreciationAndAmortization', 0),
+                                        x.col('depreciationAndAmortization', 0) + x.col('netPPE', 0)),
+    'depreciation_rate_py': lambda x: _div(x.col('depreciationAndAmortization', 1),
+                                           x.col('depreciationAndAmortization', 1) + x.col('netPPE', 1)),
+    'sga_to_sales': lambda x: _div(x.col('sellingGeneralAndAdministration', 0), x.col('totalRevenue', 0)),
+    'sga_to_sales_py': lambda x: _div(x.col('sellingGeneralAndAdministration', 1), x.col('totalRevenue', 1)),
+    'debt_to_assets': lambda x: _div(x.col('currentLiabilities', 0) + x.col('longTermDebt', 0),
+                                     x.col('totalAssets', 0)),
+    'debt_to_assets_py': lambda x: _div(x.col('currentLiabilities', 1) + x.col('longTermDebt', 1),
+                                        x.col('totalAssets', 1)),
+    'accruals_to_assets': lambda x: _div(x.col('netIncome', 0) - x.col('operatingCashFlow', 0),
+                                         x.col('totalAssets', 0)),
+}
+
+
+def _piotroski(x: FactorFrame) -> np.ndarray:
+    # Comparisons against NaN are False, so missing values and zero denominators score 0
+    signals = [
+        x['roa'] > 0,
+        x.col('operatingCashFlow', 0) > 0,
+        x['roa'] > x['roa_py'],
+        x['cfo_to_assets'] > x['roa'],
+        x['leverage'] < x['leverage_py'],
+        x['current_ratio'] > x['current_ratio_py'],
+        x.col('commonStock', 0) <= x.col('commonStock', 1),
+        x['gross_margin'] > x['gross_margin_py'],
+        x['asset_turnover'] > x['asset_turnover_py'],
+    ]
+    return np.sum(signals, axis=0)
+
+
+def _altman_z(x: FactorFrame) -> np.ndarray:
+    assets = x.col('totalAssets', 0)
+    return 1.2 * _div(x['working_capital'], assets) \
+        + 1.4 * _div(x.col('retainedEarnings', 0), assets) \
+        + 3.3 * _div(x.col('ebit', 0), assets) \
+        + 0.6 * _div(x.stat('marketCap'), x.col('totalLiabilitiesNetMinorityInterest', 0)) \
+        + 1.0 * _div(x.col('totalRevenue', 0), assets)
+
+
+def _beneish_m(x: FactorFrame) -> np.ndarray:
+    return -4.84 \
+        + 0.920 * _div(x['receivables_to_sales'], x['receivables_to_sales_py']) \
+        + 0.528 * _div(x['gross_margin_py'], x['gross_margin']) \
+        + 0.404 * _div(x['soft_assets'], x['soft_assets_py']) \
+        + 0.892 * _div(x.col('totalRevenue', 0), x.col('totalRevenue', 1)) \
+        + 0.115 * _div(x['depreciation_rate_py'], x['depreciation_rate']) \
+        - 0.172 * _div(x['sga_to_sales'], x['sga_to_sales_py']) \
+        + 4.679 * x['accruals_to_assets'] \
+        - 0.327 * _div(x['debt_to_assets'], x['debt_to_assets_py'])
+
+
+def _magic_formula(x: FactorFrame) -> np.ndarray:
+    # Rank of the sum of the earnings yield and return on capital ranks, 1 is the best
+    combined = _rank(x['earnings_yield'], ascending=False) + _rank(x['return_on_capital'], ascending=False)
+    return _rank(combined)
+
+
+PIOTROSKI = Factor('piotroskiFScore', _piotroski, years=3)
+ALTMAN_Z = Factor('altmanZScore', _altman_z)
+BENEISH_M = Factor('beneishMScore', _beneish_m, years=2, ascending=True)
+GRAHAM_NUMBER = Factor('grahamNumber', lambda x: x['graham_number'])
+GRAHAM_UPSIDE = Factor('grahamUpside', lambda x: _div(x['graham_number'], x.stat('previousClose')) - 1)
+MAGIC_FORMULA = Factor('magicFormulaRank', _magic_formula, ascending=True)
+
+FACTORS = (PIOTROSKI, ALTMAN_Z, BENEISH_M, GRAHAM_NUMBER, GRAHAM_UPSIDE, MAGIC_FORMULA)
+
+
+class FactorEngine:
+    def __init__(self,
+                 factors: Union[list, tuple, None] = None,
+                 intermediates: Union[dict, None] = None):
+        """
+        Vectorized engine evaluating many factors over the whole universe at once.
+
+        The statements are lined up by fiscal year in one pass, then every factor is evaluated as column
+        operations over all symbols. Intermediates (average assets, margins, prior-year ratios, ...) are
+        computed once and shared by the factors using them, so adding a factor does not add a pass over the data.
+
+        Example:
+        engine = FactorEngine([PIOTROSKI, Factor('roe', lambda x: x.col('netIncome') / x.col('stockholdersEquity'))])
+        engine.evaluate(statements, stats)
+
+        :param factors: Factor definitions, FACTORS by default.
+        :param intermediates: additional intermediates, merged with INTERMEDIATES.
+        """
+        self._factors = tuple(factors) if factors is not None else FACTORS
+        self._intermediates = dict(INTERMEDIATES, **(intermediates or dict()))
+        # Every intermediate reads at most the last three fiscal years
+        self._depth = max([3] + [factor.years for factor in self._factors])
+
+    @property
+    def factors(self) -> tuple:
+        return self._factors
+
+    def frame(self, statements: pd.DataFrame, stats: Union[pd.DataFrame, None] = None) -> FactorFrame:
+        """
+        Line up the statements of the universe by fiscal year.
+
+        :param statements: merged statements of any number of symbols (one row per ticker, country and asof_date).
+        :param stats: statistics of the symbols, only the latest row of every symbol is used.
+        """
+        df = statements.sort_values(['ticker', 'country', 'asof_date'], ascending=[True, True, False],
+                                    ignore_index=True)
+        df['year'] = df.groupby(['ticker', 'country']).cumcount()
+        years = df[df['year'] < self._depth].set_index(['ticker', 'country', 'year']).unstack('year')
+
+        if stats is not None and not stats.empty:
+            latest = stats.sort_values('asof_date').drop_duplicates(['ticker', 'country'], keep='last')
+            stats = latest.set_index(['ticker', 'country']).reindex(years.index)
+        else:
+            stats = pd.DataFrame(index=years.index)
+        return FactorFrame(years, stats, self._intermediates)
+
+    def evaluate(self, statements: pd.DataFrame, stats: Union[pd.DataFrame, None] = None) -> pd.DataFrame:
+        """
+        Evaluate every factor for every symbol.
+
+        :return: Pandas DataFrame with ticker, country, lastAsofDate and one column per factor.
+        """
+        frame = self.frame(statements, stats)
+        out = pd.DataFrame({factor.name: factor.evaluate(frame) for factor in self._factors}, index=frame.index)
+        out['lastAsofDate'] = frame.last_asof_date()
+        return out.reset_index()
@@ -1,11 +1,15 @@
 from typing import Union
+import numpy as np
 import pandas as pd
 
 from src.database.models import balance_sheet, cashflow_statement, profit_loss_statement, \
     stock_statistics, stock_profile, country_mapping, piotroski_score_results
+from src.database.database import query_stats
 from src.extractor.db_extractor import DbExtractor
 from src.loader.db_loader import DbLoader
+from src.stockanalyser.factor_engine import FactorEngine, PIOTROSKI
 from src.config.variables import *
+from src.utils.auxiliary import symbols_to_pairs
 
 
 class StockAnalyser:
@@ -163,14 +167,128 @@ class StockAnalyser:
 
         return results_sum
 
-    def piotroski_f_score(self, symbols: Union[str, list, None] = None) -> pd.DataFrame:
+    @staticmethod
+    def _calc_piotroski_scores(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Vectorized counterpart of _calc_piotroski_score computed for many symbols at once.
+
+        :param df: merged financial data of any number of symbols (one row per ticker, country and asof_date).
+        :return: Pandas DataFrame with ticker, country, piotroskiFScore and lastAsofDate columns.
+        """
+        # Symbols with less than three fiscal years cannot be scored, the factor engine leaves them as NaN
+        out = FactorEngine([PIOTROSKI]).evaluate(df)
+        scores = out['piotroskiFScore'].to_numpy()
+        out['piotroskiFScore'] = np.where(np.isnan(scores), 'No Data',
+                                          np.nan_to_num(scores).astype(int).astype(object))
+        return out[['ticker', 'country', 'piotroskiFScore', 'lastAsofDate']]
+
+    def _fetch(self, tablename: str, pairs: Union[list, None]) -> pd.DataFrame:
+        if pairs is None:
+            return self._db_extr.get_table_contents(tablename)
+        return self._db_extr.get_bulk_table_contents(tablename, pairs)
+
+    def _merge_statements(self, pairs: Union[list, None]) -> pd.DataFrame:
+        """Balance sheets, income and cash flow statements of the symbols merged on ticker, country and asof_date"""
+        tables = [balance_sheet.BalanceSheet, profit_loss_statement.ProfitLossStmt, cashflow_statement.CashFlowStmt]
+        statements = [self._fetch(tbl.__tablename__, pairs) for tbl in tables]
+
+        keys = ['asof_date', 'ticker', 'country']
+        df = statements[0].merge(statements[1], on=keys, how='inner', suffixes=('', '_drop')) \
+            .merge(statements[2], on=keys, how='inner', suffixes=('', '_drop'))
+        df.drop(list(df.filter(regex='_drop$')), axis=1, inplace=True)
+        return df
+
+    def _piotroski_f_score_batch(self, symbols: Union[list, None] = None) -> pd.DataFrame:
+        """Calculate the Piotroski F-Score for all passed symbols (whole universe if None) in a single pass"""
+        pairs = symbols_to_pairs(symbols) if symbols is not None else None
+
+        scores = self._calc_piotroski_scores(self._merge_statements(pairs))
+
+        stats = self._fetch(stock_statistics.StockStatistics.__tablename__, pairs)
+        profile = self._fetch(stock_profile.StockProfile.__tablename__, pairs)
+        names = self._fetch(country_mapping.CountryMapping.__tablename__, pairs)
+
+        keys = ['ticker', 'country']
+        out = stats.merge(profile, on=keys, how='inner', suffixes=('', '_drop')) \
+            .merge(names, on=keys, how='inner', suffixes=('', '_drop')) \
+            .merge(scores, on=keys, how='inner')
+        out.drop(list(out.filter(regex='_drop$')), axis=1, inplace=True)
+
+        # Keeping the order of the per-symbol output: symbols as passed, then by trailingPE within each symbol
+        symbol = out['ticker'] + '-' + out['country']
+        order = {f'{ticker}-{country}': i for i, (ticker, country) in enumerate(pairs)} if pairs is not None else {}
+        out['_order'] = symbol.map(order) if pairs is not None else symbol
+        out.sort_values(['_order', 'trailingPE'], inplace=True, na_position='last', ignore_index=True)
+
+        return out[PIOTROSKI_OUT_COLS]
+
+    def piotroski_f_score(self,
+                          symbols: Union[str, list, None] = None,
+                          batch: bool = False,
+                          print_query_summary: bool = False) -> pd.DataFrame:
+        """
+        Calculate the Piotroski F-Score and store the results in the database.
+
+        :param symbols: symbols in the 'ticker-country' format. Previously set symbols are used if None.
+        :param batch: if True, all statements are loaded at once and the scores are calculated for every symbol
+        in a single vectorized pass. In batch mode None symbols means the whole universe.
+        :param print_query_summary: if True, the SQL statistics of the calculation are printed.
+        """
+        query_stats.reset()
         self._symbols = symbols if symbols is not None else self._symbols
 
         if isinstance(self._symbols, str):
             self._symbols = [self._symbols]
 
+        if batch:
+            out_df = self._piotroski_f_score_batch(self._symbols)
+        else:
+            out_df = self._piotroski_f_score_loop(self._symbols)
+
+        pfscore_name = piotroski_score_results.PiotroskiFScore.__tablename__
+        self._db_load.delete_contents(pfscore_name)
+        self._db_load.append_data(pfscore_name, out_df)
+        if print_query_summary:
+            print(query_stats.summary())
+
+        return out_df
+
+    def factor_scores(self,
+                      symbols: Union[str, list, None] = None,
+                      factors: Union[list, None] = None) -> pd.DataFrame:
+        """
+        Evaluate many factors (Piotroski, Altman Z, Beneish M, Graham number, magic formula rank, ...)
+        for all passed symbols in a single vectorized pass.
+
+        :param symbols: symbols in the 'ticker-country' format, the whole universe if None.
+        :param factors: Factor definitions of the factor engine, all predefined FACTORS if None.
+        :return: Pandas DataFrame with the FACTOR_OUT_COLS and one column per factor, sorted by the first factor.
+        """
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        pairs = symbols_to_pairs(symbols) if symbols is not None else None
+
+        engine = FactorEngine(factors)
+        stats = self._fetch(stock_statistics.StockStatistics.__tablename__, pairs)
+        scores = engine.evaluate(self._merge_statements(pairs), stats)
+
+        latest = stats.sort_values('asof_date').drop_duplicates(['ticker', 'country'], keep='last')
+        profile = self._fetch(stock_profile.StockProfile.__tablename__, pairs)
+        names = self._fetch(country_mapping.CountryMapping.__tablename__, pairs)
+
+        keys = ['ticker', 'country']
+        out = scores.merge(latest.drop(columns='asof_date'), on=keys, how='left') \
+            .merge(profile, on=keys, how='left', suffixes=('', '_drop')) \
+            .merge(names, on=keys, how='left', suffixes=('', '_drop'))
+        out.drop(list(out.filter(regex='_drop$')), axis=1, inplace=True)
+
+        first = engine.factors[0]
+        out.sort_values(first.name, ascending=first.ascending, inplace=True, na_position='last', ignore_index=True)
+        return out.reindex(columns=FACTOR_OUT_COLS + [factor.name for factor in engine.factors])
+
+    def _piotroski_f_score_loop(self, symbols: list) -> pd.DataFrame:
         out = list()
-        for comp in self._symbols:
+        for comp in symbols:
             df = self.merge_financial_data(comp)
             score = self._calc_piotroski_score(df)
             ly = df.asof_date[0]
@@ -178,10 +296,4 @@ class StockAnalyser:
                                            indicators={'piotroskiFScore': score, 'lastAsofDate': ly},
                                            sort_by={'piotroskiFScore': 'descending', 'trailingPE': 'ascending'},
                                            output_columns=PIOTROSKI_OUT_COLS))
-        out_df = pd.concat(out)
-
-        pfscore_name = piotroski_score_results.PiotroskiFScore.__tablename__
-        self._db_load.delete_contents(pfscore_name)
-        self._db_load.append_data(pfscore_name, out_df)
-
-        return out_df
+        return pd.concat(out)
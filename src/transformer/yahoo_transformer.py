@@ -1,5 +1,5 @@
-# TODO Add function that would filter certain dates based on what's already in the internal DB
 from typing import Union
+from functools import lru_cache
 import pandas as pd
 from datetime import date
 
@@ -8,6 +8,21 @@ from src.loader.db_loader import DbLoader
 from src.extractor.db_extractor import DbExtractor
 from src.database.models import balance_sheet, cashflow_statement, profit_loss_statement, stock_statistics, stock_profile
 from src.utils.exceptions import EmptyStatementError
+from src.utils.erroneous_registry import ErroneousRegistry
+
+_MODELS = {'balance': balance_sheet.BalanceSheet,
+           'income': profit_loss_statement.ProfitLossStmt,
+           'cash': cashflow_statement.CashFlowStmt,
+           'stats': stock_statistics.StockStatistics,
+           'profile': stock_profile.StockProfile}
+
+
+@lru_cache(maxsize=None)
+def model_columns(data_type: str) -> tuple:
+    """Column names of the model the data type is loaded into, computed once per data type"""
+    if data_type not in _MODELS:
+        raise ValueError(f'{data_type} was not recognized. Please correct and run again.')
+    return tuple(col.name for col in _MODELS[data_type].__table__.columns)
 
 
 class YahooTransformer(DataTransformer):
@@ -17,17 +32,32 @@ class YahooTransformer(DataTransformer):
                  inc_stmt: Union[dict, None] = None,
                  cash_stmt: Union[dict, None] = None,
                  comp_stats: Union[dict, None] = None,
-                 comp_profile: Union[dict, None] = None
+                 comp_profile: Union[dict, None] = None,
+                 watermarks: Union[dict, None] = None,
+                 erroneous_registry: Union[ErroneousRegistry, None] = None
                  ):
+        """
+        YahooTransformer class constructor.
+
+        :param watermarks: optional Python dict {(ticker, country): {data_type: latest loaded asof_date}}
+        as returned by DbExtractor.get_watermarks. If passed, only rows newer than the watermark are kept.
+        A None watermark (e.g. profile) means the symbol is already loaded and all its rows are dropped.
+        :param erroneous_registry: registry of the erroneous symbols. If passed, the caller is responsible
+        for flushing it, otherwise a new registry is created and flushed at the end of process_data.
+        """
         super().__init__()
         self._balance_sheet = raw_data['balance'] if raw_data else blnc_sht
         self._income_statement = raw_data['income'] if raw_data else inc_stmt
         self._cashflow_statement = raw_data['cash'] if raw_data else cash_stmt
         self._company_statistics = raw_data['stats'] if raw_data else comp_stats
         self._company_profile = raw_data['profile'] if raw_data else comp_profile
+        self._watermarks = watermarks
 
         self._db_extr = DbExtractor(auto_login=True)
         self._db_load = DbLoader(auto_login=True)
+        self._own_registry = erroneous_registry is None
+        self._erroneous = erroneous_registry if erroneous_registry is not None \
+            else ErroneousRegistry(self._db_load)
 
     @property
     def raw_data(self):
@@ -79,29 +109,20 @@ class YahooTransformer(DataTransformer):
 
     def __handle_empty_error(self, symbol, error) -> None:
         comp, country = symbol.split('-')
-        err_ticks = self._db_extr.get_erroneous()
-        if comp not in err_ticks:
-            self._db_load.load_erroneous(comp, country, error)
+        self._erroneous.add(comp, country, error)
         print(f'Could not process data for {comp}-{country}. Reason: {error}')
 
-    def _filter_columns(self, statement_type) -> pd.DataFrame:
-        if statement_type == 'balance':
-            cols = [col.name for col in balance_sheet.BalanceSheet.__table__.columns]
-        elif statement_type == 'income':
-            cols = [col.name for col in profit_loss_statement.ProfitLossStmt.__table__.columns]
-        elif statement_type == 'cash':
-            cols = [col.name for col in cashflow_statement.CashFlowStmt.__table__.columns]
-        elif statement_type == 'stats':
-            cols = [col.name for col in stock_statistics.StockStatistics.__table__.columns]
-        elif statement_type == 'profile':
-            cols = [col.name for col in stock_profile.StockProfile.__table__.columns]
-        else:
-            raise ValueError(f'{statement_type} was not recognized. Please correct and run again.')
-
-        if not set(cols).issubset(set(self._processed_data.columns)):
-            self._processed_data = self._processed_data.reindex(columns=cols, fill_value=None)
-
-        self._processed_data = self._processed_data[cols]
+    def _filter_watermarks(self, data_type) -> pd.DataFrame:
+        if not self._watermarks or self._processed_data.empty:
+            return self._processed_data
+
+        df = self._processed_data
+        marks = [self._watermarks.get((ticker, country), dict()) for ticker, country in zip(df['ticker'], df['country'])]
+        loaded = pd.Series([data_type in mark for mark in marks], index=df.index)
+        mark_dates = pd.to_datetime(pd.Series([mark.get(data_type) for mark in marks], index=df.index))
+        newer = pd.to_datetime(df['asof_date']) > mark_dates if 'asof_date' in df.columns else False
+
+        self._processed_data = df[~loaded | (mark_dates.notna() & newer)]
         return self._processed_data
 
     def process_data(self,
@@ -118,12 +139,16 @@ class YahooTransformer(DataTransformer):
         self._company_statistics = comp_stats if comp_stats is not None else self._company_statistics
         self._company_profile = comp_profile if comp_profile is not None else self._company_profile
 
-        results = {'balance': self.process_statement(self._balance_sheet, 'balance'),
-                   'income': self.process_statement(self._income_statement, 'income'),
-                   'cash': self.process_statement(self._cashflow_statement, 'cash'),
-                   'stats': self.process_company_data(self._company_statistics, 'stats'),
-                   'profile': self.process_company_data(self._company_profile, 'profile'),
-                   }
+        try:
+            results = {'balance': self.process_statement(self._balance_sheet, 'balance'),
+                       'income': self.process_statement(self._income_statement, 'income'),
+                       'cash': self.process_statement(self._cashflow_statement, 'cash'),
+                       'stats': self.process_company_data(self._company_statistics, 'stats'),
+                       'profile': self.process_company_data(self._company_profile, 'profile'),
+                       }
+        finally:
+            if self._own_registry:
+                self._erroneous.flush()
 
         return results
 
@@ -132,23 +157,24 @@ class YahooTransformer(DataTransformer):
                           statement_type: str = None) -> pd.DataFrame:
         self._raw_data = raw_data if raw_data else self._raw_data
 
-        tickers = list(self._raw_data.keys())
-        full_data = []
+        cols = model_columns(statement_type)
+        rows = list()
+        processed_any = False
 
-        for tick in tickers:
-            data = self._raw_data[tick]
+        for tick, data in self._raw_data.items():
             if not data:
                 self.__handle_empty_error(tick, f"Empty {statement_type}")
                 continue
+            processed_any = True
+            ticker, country = tick.split('-')
             for elem in data:
-                df = pd.DataFrame.from_dict(elem, orient='index')
-                df.reset_index(names='asof_date', inplace=True)
-                df[['ticker', 'country']] = tick.split('-')
-                full_data.append(df)
-        if not full_data:
+                for asof_date, values in elem.items():
+                    if values:
+                        rows.append(dict(values, asof_date=asof_date, ticker=ticker, country=country))
+        if not processed_any:
             raise EmptyStatementError
-        self._processed_data = pd.concat(full_data)
-        self._processed_data = self._filter_columns(statement_type)
+        self._processed_data = self._build_frame(rows, cols)
+        self._processed_data = self._filter_watermarks(statement_type)
         return self._processed_data
 
     def process_company_data(self,
@@ -156,16 +182,19 @@ class YahooTransformer(DataTransformer):
                              data_type: str = None):
         self._raw_data = raw_data if raw_data else self._raw_data
 
-        tickers = list(self._raw_data.keys())
-        full_data = []
-
-        for tick in tickers:
-            data = self._raw_data[tick]
-            df = pd.DataFrame(data)
-            df['asof_date'] = date.today()
-            df[['ticker', 'country']] = tick.split('-')
-            full_data.append(df)
-        self._processed_data = pd.concat(full_data)
-        self._processed_data = self._filter_columns(data_type)
+        cols = model_columns(data_type)
+        today = date.today()
+        rows = list()
+
+        for tick, data in self._raw_data.items():
+            ticker, country = tick.split('-')
+            for values in data:
+                rows.append(dict(values or dict(), asof_date=today, ticker=ticker, country=country))
+        self._processed_data = self._build_frame(rows, cols)
+        self._processed_data = self._filter_watermarks(data_type)
         return self._processed_data
 
+    @staticmethod
+    def _build_frame(rows: list, cols: tuple) -> pd.DataFrame:
+        """Build the model DataFrame from the flattened rows in one go, keeping only the model columns"""
+        return pd.DataFrame.from_records(rows, columns=list(cols))
@@ -11,3 +11,8 @@ def grouper(iterable, chunk_size, fillvalue=None):
 def process_symbols(raw_symbols: pd.DataFrame) -> dict:
     """Change symbols object format to align with the XTB output"""
     return raw_symbols.groupby('country')['ticker'].apply(list).to_dict()
+
+
+def symbols_to_pairs(symbols: list) -> list:
+    """Change 'ticker-country' symbols into (ticker, country) pairs, pairs are passed through unchanged"""
+    return [tuple(symb.split('-')) if isinstance(symb, str) else tuple(symb) for symb in symbols]
@@ -0,0 +1,74 @@
+from typing import Union
+import threading
+from sqlalchemy import select
+
+from src.database.context import DbContext, get_db_context
+from src.database.models.erroneous_symbols import ErroneousSymbols
+from src.loader.db_loader import DbLoader
+
+
+class ErroneousRegistry:
+    def __init__(self,
+                 db_load: Union[DbLoader, None] = None,
+                 db_context: Union[DbContext, None] = None):
+        """
+        In-memory registry of the symbols that could not be extracted or processed.
+
+        The erroneous symbols are loaded once into a set keyed by (ticker, country). New failures are buffered
+        and written to the database in bulk by flush, e.g. at the end of every ETL chunk.
+        """
+        self._db_context = db_context if db_context is not None else get_db_context()
+        self._db_load = db_load if db_load is not None else DbLoader(auto_login=True)
+        self._symbols: set = set()
+        self._pending: list = list()
+        self._lock = threading.Lock()
+
+        self.load()
+
+    @property
+    def symbols(self) -> set:
+        return self._symbols
+
+    @property
+    def tickers(self) -> list:
+        return [ticker for ticker, country in self._symbols]
+
+    @property
+    def pending(self) -> list:
+        return self._pending
+
+    def __contains__(self, symbol: tuple) -> bool:
+        return tuple(symbol) in self._symbols
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def load(self) -> None:
+        tbl = self._db_context.get_table(ErroneousSymbols.__tablename__)
+        with self._db_context.engine.connect() as conn:
+            result = conn.execute(select([tbl.c.ticker, tbl.c.country])).fetchall()
+        with self._lock:
+            self._symbols = set((ticker, country) for ticker, country in result)
+
+    def add(self, ticker: str, country: str, reason: str) -> bool:
+        """Register the failed symbol. Returns False if the symbol was already registered."""
+        with self._lock:
+            if (ticker, country) in self._symbols:
+                return False
+            self._symbols.add((ticker, country))
+            self._pending.append({'ticker': ticker, 'country': country, 'reason': reason})
+            return True
+
+    def flush(self) -> int:
+        """Write all buffered failures to the database, returns the number of written symbols"""
+        with self._lock:
+            pending, self._pending = self._pending, list()
+        if pending:
+            try:
+                self._db_load.load_erroneous_bulk(pending)
+            except Exception:
+                # Keeping the failures for the next flush, ahead of the ones added in the meantime
+                with self._lock:
+                    self._pending = pending + self._pending
+                raise
+        return len(pending)
@@ -1,2 +1,6 @@
 class EmptyStatementError(Exception):
     pass
+
+
+class TransportError(Exception):
+    pass
@@ -0,0 +1,157 @@
+from typing import Union, Callable, Iterable
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(self,
+                 name: str,
+                 func: Callable,
+                 workers: int = 1,
+                 batch_size: int = 1):
+        """
+        Pipeline stage run by its own worker threads.
+
+        :param name: name of the stage used in the summary.
+        :param func: function called with every item of the input queue, or with a list of up to batch_size items
+        if batch_size > 1. Its result is passed to the next stage, None results are dropped.
+        :param workers: number of worker threads of the stage.
+        :param batch_size: if > 1, every call gets the item it waited for plus the items already queued behind it,
+        so a slow consumer (e.g. a database load) handles bigger batches when it falls behind.
+        """
+        if workers < 1 or batch_size < 1:
+            raise ValueError(f'Workers and batch size have to be at least 1. {workers} and {batch_size} passed.')
+
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._running = 0
+
+    def summary(self) -> str:
+        return f'{self.name}: {self.processed} items, {self.failed} failed, {self.busy_seconds:.1f} s busy ' \
+               f'({self.workers} workers)'
+
+
+class Pipeline:
+    def __init__(self,
+                 stages: list,
+                 queue_size: int = 100,
+                 on_error: Union[Callable, None] = None):
+        """
+        Streaming pipeline of stages connected by bounded queues.
+
+        All stages run at the same time, a stage blocks when the queue of the next one is full, so a slow stage
+        slows down the ones before it instead of letting the items pile up in memory.
+        The wall-clock time of a run approaches the time of the slowest stage rather than the sum of all of them.
+
+        :param stages: list of Stage objects in the order the items flow through them.
+        :param queue_size: capacity of every queue between two stages.
+        :param on_error: function called with (stage, item, exception) when a stage function fails.
+        The item is dropped and the pipeline carries on. Defaults to printing the error.
+
+        Example:
+        pipeline = Pipeline([Stage('extract', extract, workers=4), Stage('load', load, batch_size=50)])
+        pipeline.run(symbols)
+        """
+        if not stages:
+            raise ValueError('At least one stage has to be passed.')
+
+        self._stages = stages
+        self._queue_size = queue_size
+        self._on_error = on_error if on_error is not None else self._print_error
+        self._wall_seconds = 0.0
+
+    @property
+    def stages(self) -> list:
+        return self._stages
+
+    @property
+    def wall_seconds(self) -> float:
+        return self._wall_seconds
+
+    @staticmethod
+    def _print_error(stage: Stage, item, error: Exception) -> None:
+        print(f'Stage {stage.name} failed to process {item}. Reason: {error}')
+
+    def run(self, items: Iterable) -> list:
+        """Push all items through the pipeline and wait for all stages to finish, returns the stages"""
+        started = time.perf_counter()
+        queues = [queue.Queue(maxsize=self._queue_size) for _ in self._stages]
+
+        threads = list()
+        for i, stage in enumerate(self._stages):
+            stage._running = stage.workers
+            out_queue = queues[i + 1] if i + 1 < len(self._stages) else None
+            next_workers = self._stages[i + 1].workers if out_queue is not None else 0
+            for _ in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(stage, queues[i], out_queue, next_workers),
+                                          name=f'pipeline-{stage.name}', daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        for item in items:
+            queues[0].put(item)
+        for _ in range(self._stages[0].workers):
+            queues[0].put(_DONE)
+
+        for thread in threads:
+            thread.join()
+        self._wall_seconds = time.perf_counter() - started
+        return self._stages
+
+    def _work(self, stage: Stage, in_queue: queue.Queue, out_queue: Union[queue.Queue, None], next_workers: int):
+        done = False
+        while not done:
+            batch = [in_queue.get()]
+            if batch[0] is _DONE:
+                break
+            while len(batch) < stage.batch_size:
+                try:
+                    item = in_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+
+            arg = batch if stage.batch_size > 1 else batch[0]
+            started = time.perf_counter()
+            try:
+                result = stage.func(arg)
+            except Exception as e:
+                result = None
+                with stage._lock:
+                    stage.failed += len(batch)
+                self._on_error(stage, arg, e)
+            else:
+                with stage._lock:
+                    stage.processed += len(batch)
+            finally:
+                with stage._lock:
+                    stage.busy_seconds += time.perf_counter() - started
+
+            if result is not None and out_queue is not None:
+                out_queue.put(result)
+
+        # The last worker of the stage to finish tells the workers of the next stage that no more items will come
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if last and out_queue is not None:
+            for _ in range(next_workers):
+                out_queue.put(_DONE)
+
+    def summary(self) -> str:
+        """Human readable summary of the last run"""
+        lines = [f'Pipeline summary: {self._wall_seconds:.1f} s wall-clock.']
+        lines.extend(f'  {stage.summary()}' for stage in self._stages)
+        return '\n'.join(lines)
@@ -0,0 +1,120 @@
+from typing import Union
+import multiprocessing
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self,
+                 rate: float,
+                 burst: int = 1,
+                 max_in_flight: Union[int, None] = None):
+        """
+        Thread-safe token-bucket rate limiter.
+
+        :param rate: number of tokens (requests) added to the bucket per second.
+        :param burst: capacity of the bucket, i.e. how many requests can be sent at once after an idle period.
+        :param max_in_flight: maximum number of requests running at the same time. Defaults to burst.
+
+        Example:
+        limiter = TokenBucket(rate=2, burst=5, max_in_flight=4)
+        with limiter:
+            send_request()
+
+        A task sending several requests takes a token per request:
+        limiter.acquire(tokens=3)
+        try:
+            send_three_requests()
+        finally:
+            limiter.release()
+        """
+        if rate <= 0 or burst < 1:
+            raise ValueError(f'Rate has to be positive and burst at least 1. {rate} and {burst} passed.')
+
+        self._rate = rate
+        self._burst = burst
+        self._max_in_flight = max_in_flight if max_in_flight is not None else burst
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(self._max_in_flight)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def burst(self):
+        return self._burst
+
+    @property
+    def max_in_flight(self):
+        return self._max_in_flight
+
+    def _take_token(self) -> float:
+        """Take a token if available, otherwise return the number of seconds until the next one"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self._rate
+
+    def take(self, tokens: int = 1) -> None:
+        """Block until the tokens of that many requests are taken, without taking an in-flight slot"""
+        for _ in range(tokens):
+            while True:
+                wait = self._take_token()
+                if not wait:
+                    break
+                time.sleep(wait)
+
+    def acquire(self, tokens: int = 1) -> None:
+        """Block until an in-flight slot is free and the tokens of that many requests are taken"""
+        self._in_flight.acquire()
+        self.take(tokens)
+
+    def release(self) -> None:
+        """Mark a request as finished"""
+        self._in_flight.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class ProcessTokenBucket(TokenBucket):
+    def __init__(self,
+                 rate: float,
+                 burst: int = 1,
+                 max_in_flight: Union[int, None] = None,
+                 mp_context=None):
+        """
+        Token-bucket rate limiter shared by several processes.
+
+        The bucket state lives in shared memory, so a single instance passed to the workers of a process pool
+        (e.g. through the pool initializer) limits the requests of all of them together.
+        """
+        super().__init__(rate, burst, max_in_flight)
+        ctx = mp_context if mp_context is not None else multiprocessing.get_context()
+
+        # [available tokens, last refill time], guarded by the array lock
+        self._state = ctx.Array('d', [float(burst), time.monotonic()])
+        self._in_flight = ctx.BoundedSemaphore(self._max_in_flight)
+        self._lock = None
+
+    def _take_token(self) -> float:
+        with self._state.get_lock():
+            now = time.monotonic()
+            tokens = min(self._burst, self._state[0] + (now - self._state[1]) * self._rate)
+            self._state[1] = now
+            if tokens >= 1:
+                self._state[0] = tokens - 1
+                return 0.0
+            self._state[0] = tokens
+            return (1 - tokens) / self._rate
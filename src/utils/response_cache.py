@@ -0,0 +1,157 @@
+from typing import Union
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Number of buffered access times written to the cache file at once
+_ACCESS_FLUSH_SIZE = 100
+
+
+class ResponseCache:
+    def __init__(self,
+                 path: str,
+                 ttls: Union[dict, None] = None,
+                 max_bytes: int = 512 * 1024 ** 2,
+                 default_ttl: float = 86400):
+        """
+        Persistent response cache stored in a SQLite file.
+
+        Entries are keyed by ticker, endpoint and frequency. Every endpoint has its own time to live and the total size
+        of the stored responses is kept below max_bytes by evicting the least recently used entries.
+        The total size is kept in memory, and the access times of the hits are buffered and written with the next
+        set, in batches of _ACCESS_FLUSH_SIZE or on close, so reads do not write to the file.
+
+        :param path: path of the SQLite file. Parent directories are created if necessary.
+        :param ttls: Python dict {endpoint: time to live in seconds}.
+        :param max_bytes: maximum total size of the stored responses.
+        :param default_ttl: time to live of endpoints missing in ttls.
+
+        Example:
+        cache = ResponseCache('yahoo_cache.sqlite', ttls={'balance': 30 * 86400, 'stats': 12 * 3600})
+        cache.set('AAPL', 'stats', 'annual', {'trailingPE': 25.1})
+        cache.get('AAPL', 'stats', 'annual')
+        """
+        self._path = path
+        self._ttls = ttls if ttls is not None else dict()
+        self._max_bytes = max_bytes
+        self._default_ttl = default_ttl
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+        self._accessed: dict = dict()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                           'ticker TEXT, endpoint TEXT, frequency TEXT, value TEXT, size INTEGER, '
+                           'created_at REAL, accessed_at REAL, PRIMARY KEY (ticker, endpoint, frequency))')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_responses_accessed_at ON responses (accessed_at)')
+        self._conn.commit()
+        self._total = self._stored_size()
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def evictions(self):
+        return self._evictions
+
+    @property
+    def size(self) -> int:
+        return self._total
+
+    def _stored_size(self) -> int:
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _ttl(self, endpoint: str) -> float:
+        return self._ttls.get(endpoint, self._default_ttl)
+
+    def get(self, ticker: str, endpoint: str, frequency: str, default=None):
+        """Return the cached response or default if it is missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, created_at FROM responses '
+                                     'WHERE ticker = ? AND endpoint = ? AND frequency = ?',
+                                     (ticker, endpoint, frequency)).fetchone()
+            if row is None or now - row[1] > self._ttl(endpoint):
+                self._misses += 1
+                return default
+
+            self._accessed[(ticker, endpoint, frequency)] = now
+            if len(self._accessed) >= _ACCESS_FLUSH_SIZE:
+                self._flush_accessed()
+                self._conn.commit()
+            self._hits += 1
+        return json.loads(row[0])
+
+    def _flush_accessed(self) -> None:
+        if not self._accessed:
+            return
+        self._conn.executemany('UPDATE responses SET accessed_at = ? '
+                               'WHERE ticker = ? AND endpoint = ? AND frequency = ?',
+                               [(accessed_at, *key) for key, accessed_at in self._accessed.items()])
+        self._accessed.clear()
+
+    def set(self, ticker: str, endpoint: str, frequency: str, value) -> None:
+        """Store the response and evict the least recently used ones if the cache exceeds max_bytes"""
+        data = json.dumps(value, default=str)
+        now = time.time()
+        with self._lock:
+            self._flush_accessed()
+            self._accessed.pop((ticker, endpoint, frequency), None)
+            old = self._conn.execute('SELECT size FROM responses WHERE ticker = ? AND endpoint = ? AND frequency = ?',
+                                     (ticker, endpoint, frequency)).fetchone()
+            self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (ticker, endpoint, frequency, data, len(data), now, now))
+            self._total += len(data) - (old[0] if old is not None else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        if self._total <= self._max_bytes:
+            return
+        # Other processes may write to the same file, the real size is only summed up when the limit looks exceeded
+        total = self._total = self._stored_size()
+        if total <= self._max_bytes:
+            return
+
+        rows = self._conn.execute('SELECT ticker, endpoint, frequency, size FROM responses ORDER BY accessed_at')
+        evicted = list()
+        for ticker, endpoint, frequency, size in rows:
+            if total <= self._max_bytes:
+                break
+            evicted.append((ticker, endpoint, frequency))
+            total -= size
+
+        self._conn.executemany('DELETE FROM responses WHERE ticker = ? AND endpoint = ? AND frequency = ?', evicted)
+        self._evictions += len(evicted)
+        self._total = total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+            self._accessed.clear()
+            self._total = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_accessed()
+            self._conn.commit()
+            self._conn.close()
+
+    def summary(self) -> str:
+        requests = self._hits + self._misses
+        hit_rate = self._hits / requests if requests else 0
+        return f'Response cache: {self._hits} hits, {self._misses} misses ({hit_rate:.1%} hit rate), ' \
+               f'{self._evictions} evictions, {self.size} bytes stored.'
@@ -0,0 +1,136 @@
+from typing import Union
+from datetime import datetime
+import uuid
+from sqlalchemy import select, func
+
+from src.config.variables import ETL_MAX_CHUNK_ATTEMPTS
+from src.database.context import DbContext, get_db_context
+from src.database.models.etl_run_journal import EtlRunJournal
+from src.utils.auxiliary import grouper
+
+
+class RunJournal:
+    PENDING = 'pending'
+    EXTRACTED = 'extracted'
+    TRANSFORMED = 'transformed'
+    LOADED = 'loaded'
+    EMPTY = 'empty'
+    FAILED = 'failed'
+    COMPLETED = (LOADED, EMPTY)
+    _TIMING_COLUMNS = {EXTRACTED: 'extract_seconds', TRANSFORMED: 'transform_seconds', LOADED: 'load_seconds'}
+
+    def __init__(self,
+                 run_id: Union[str, None] = None,
+                 db_context: Union[DbContext, None] = None,
+                 max_attempts: int = ETL_MAX_CHUNK_ATTEMPTS):
+        """
+        Persistent journal of an ETL run.
+
+        Every chunk of the run is recorded with its symbols, the status of the last finished stage
+        (extracted, transformed, loaded, failed), the number of attempts and the stage timings.
+        A run can be resumed by its run_id, the completed chunks are skipped and the others are retried
+        until they reach max_attempts.
+        """
+        self._db_context = db_context if db_context is not None else get_db_context()
+        self._run_id = run_id if run_id is not None else f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self._max_attempts = max_attempts
+        self._tbl = EtlRunJournal.__table__
+
+        # The journal table is created on first use
+        self._tbl.create(self._db_context.engine, checkfirst=True)
+
+    @property
+    def run_id(self) -> str:
+        return self._run_id
+
+    @property
+    def max_attempts(self) -> int:
+        return self._max_attempts
+
+    @classmethod
+    def resume(cls,
+               run_id: Union[str, None] = None,
+               db_context: Union[DbContext, None] = None,
+               max_attempts: int = ETL_MAX_CHUNK_ATTEMPTS):
+        """Open the journal of an existing run, the most recently started one if run_id is None"""
+        run_id = run_id if run_id is not None else cls.latest_run_id(db_context)
+        if run_id is None:
+            raise ValueError('There is no ETL run to resume.')
+        return cls(run_id, db_context, max_attempts)
+
+    @staticmethod
+    def latest_run_id(db_context: Union[DbContext, None] = None) -> Union[str, None]:
+        db_context = db_context if db_context is not None else get_db_context()
+        tbl = EtlRunJournal.__table__
+        tbl.create(db_context.engine, checkfirst=True)
+
+        query = select([tbl.c.run_id]).group_by(tbl.c.run_id).order_by(func.min(tbl.c.created_at).desc()).limit(1)
+        with db_context.engine.connect() as conn:
+            return conn.execute(query).scalar()
+
+    def plan(self, symbols: dict, chunk_size: int) -> dict:
+        """
+        Split the symbols into chunks and record them as pending.
+
+        :param symbols: Python dict {country: [tickers]}.
+        :return: Python dict {country: [(chunk_id, [tickers])]}.
+        """
+        now = datetime.now()
+        chunks, records = dict(), list()
+        for country, companies in symbols.items():
+            for chunk in grouper(companies, chunk_size):
+                chunk = [x for x in chunk if x is not None]
+                chunks.setdefault(country, list()).append((len(records), chunk))
+                records.append({'run_id': self._run_id, 'chunk_id': len(records), 'country': country,
+                                'symbols': ','.join(chunk), 'status': self.PENDING, 'attempts': 0,
+                                'created_at': now, 'updated_at': now})
+        if records:
+            with self._db_context.engine.begin() as conn:
+                conn.execute(self._tbl.insert(), records)
+        return chunks
+
+    def pending_chunks(self) -> dict:
+        """
+        Get the chunks of the run that still need processing: not completed and below the maximum attempts.
+
+        :return: Python dict {country: [(chunk_id, [tickers])]}.
+        """
+        tbl = self._tbl
+        query = select([tbl.c.chunk_id, tbl.c.country, tbl.c.symbols]) \
+            .where(tbl.c.run_id == self._run_id) \
+            .where(tbl.c.status.notin_(self.COMPLETED)) \
+            .where(tbl.c.attempts < self._max_attempts) \
+            .order_by(tbl.c.chunk_id)
+        chunks = dict()
+        with self._db_context.engine.connect() as conn:
+            for chunk_id, country, symbols in conn.execute(query):
+                chunks.setdefault(country, list()).append((chunk_id, symbols.split(',') if symbols else list()))
+        return chunks
+
+    def start(self, chunk_id: int) -> None:
+        """Record a new attempt of the chunk"""
+        self._update(chunk_id, status=self.PENDING, attempts=self._tbl.c.attempts + 1, error=None)
+
+    def mark(self, chunk_id: int, status: str, seconds: Union[float, None] = None, error: Union[str, None] = None):
+        """Record the finished stage of the chunk and its duration"""
+        values = {'status': status}
+        if seconds is not None and status in self._TIMING_COLUMNS:
+            values[self._TIMING_COLUMNS[status]] = seconds
+        if error is not None:
+            values['error'] = error
+        self._update(chunk_id, **values)
+
+    def _update(self, chunk_id: int, **values) -> None:
+        query = self._tbl.update() \
+            .where(self._tbl.c.run_id == self._run_id) \
+            .where(self._tbl.c.chunk_id == chunk_id) \
+            .values(updated_at=datetime.now(), **values)
+        with self._db_context.engine.begin() as conn:
+            conn.execute(query)
+
+    def summary(self) -> dict:
+        """Number of chunks of the run per status"""
+        tbl = self._tbl
+        query = select([tbl.c.status, func.count()]).where(tbl.c.run_id == self._run_id).group_by(tbl.c.status)
+        with self._db_context.engine.connect() as conn:
+            return {status: count for status, count in conn.execute(query)}
@@ -0,0 +1,161 @@
+from typing import Union
+from urllib.parse import quote, unquote
+import os
+import numpy as np
+import pandas as pd
+
+from src.config.variables import XTB_PRICES_PATH
+
+# Price columns are int64 scaled by 10 ** digits, ctm is the candle start as an XTB timestamp (ms)
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+CANDLE_COLUMNS = ('ctm',) + PRICE_COLUMNS + ('vol',)
+_SUFFIX = '.npy'
+
+
+class OhlcvStore:
+    def __init__(self, path: str = XTB_PRICES_PATH):
+        """
+        Columnar on-disk store of the XTB candles.
+
+        Every symbol is kept in its own .npy file holding one int64 array with a row per column: ctm, the open,
+        high, low and close prices scaled by 10 ** digits (the way getChartRangeRequest sends them, so no
+        precision is lost) and the volume rounded to whole units. The first column of the array is a header
+        with the digits. The file names are the percent-encoded symbols, so every symbol maps to its own file.
+        Appending only rewrites the file of the symbol, reading the full history of a symbol is a single
+        array load and the columns are returned as views of its rows.
+
+        Example:
+        store = OhlcvStore()
+        store.append('AAPL.US_9', resp['returnData'])
+        store.frame('AAPL.US_9'), store.read_many(store.symbols)
+        """
+        self._path = path
+        # ctm of the last stored candle per symbol, filled as the symbols are read or written
+        self._last_ctm: dict = dict()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def symbols(self) -> list:
+        if not os.path.isdir(self._path):
+            return list()
+        return sorted(unquote(name[:-len(_SUFFIX)]) for name in os.listdir(self._path) if name.endswith(_SUFFIX))
+
+    def __contains__(self, symbol: str) -> bool:
+        return os.path.exists(self._file(symbol))
+
+    def _file(self, symbol: str) -> str:
+        return os.path.join(self._path, quote(symbol, safe='') + _SUFFIX)
+
+    @staticmethod
+    def parse(return_data: dict) -> tuple:
+        """
+        Parse the returnData of getChartRangeRequest / getChartLastRequest.
+
+        XTB sends the open price scaled by 10 ** digits and the high, low and close prices as shifts from it.
+
+        :return: (digits, Python dict of the CANDLE_COLUMNS arrays) with absolute int-scaled prices.
+        """
+        rates = return_data['rateInfos']
+        count = len(rates)
+
+        def column(field: str, dtype) -> np.ndarray:
+            return np.fromiter((rate[field] for rate in rates), dtype=dtype, count=count)
+
+        open_ = np.rint(column('open', 'f8')).astype('i8')
+        columns = {'ctm': column('ctm', 'i8'), 'open': open_}
+        for col in PRICE_COLUMNS[1:]:
+            columns[col] = open_ + np.rint(column(col, 'f8')).astype('i8')
+        columns['vol'] = np.rint(column('vol', 'f8')).astype('i8')
+        return int(return_data['digits']), columns
+
+    def read(self, symbol: str) -> Union[tuple, None]:
+        """
+        Read the full history of the symbol.
+
+        :return: (digits, Python dict of the CANDLE_COLUMNS arrays), None if the symbol is not stored.
+        """
+        try:
+            data = np.load(self._file(symbol), allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        digits = int(data[0, 0])
+        columns = {col: row for col, row in zip(CANDLE_COLUMNS, data[:, 1:])}
+        self._last_ctm[symbol] = int(columns['ctm'][-1]) if len(columns['ctm']) else None
+        return digits, columns
+
+    def read_many(self, symbols: Union[list, None] = None) -> dict:
+        """Read the full history of many symbols, all stored ones by default. Missing symbols are skipped."""
+        results = dict()
+        for symbol in symbols if symbols is not None else self.symbols:
+            history = self.read(symbol)
+            if history is not None:
+                results[symbol] = history
+        return results
+
+    def last_ctm(self, symbol: str) -> Union[int, None]:
+        """Start of the last stored candle of the symbol (ms), None if the symbol has no candles"""
+        if symbol not in self._last_ctm:
+            self.read(symbol)
+        return self._last_ctm.get(symbol)
+
+    def append(self, symbol: str, return_data: dict) -> int:
+        """
+        Merge the getChartRangeRequest returnData into the stored history of the symbol.
+
+        Candles starting at or after the first new candle are replaced, so the last, still open candle
+        of the previous fetch is updated.
+
+        :return: number of candles added to the history.
+        """
+        digits, new = self.parse(return_data)
+        if not len(new['ctm']):
+            return 0
+
+        stored = self.read(symbol)
+        added = len(new['ctm'])
+        if stored is not None:
+            old_digits, old = stored
+            if old_digits != digits:
+                old = {col: self._rescale(values, old_digits, digits) if col in PRICE_COLUMNS else values
+                       for col, values in old.items()}
+            keep = old['ctm'] < new['ctm'][0]
+            added -= len(old['ctm']) - int(keep.sum())
+            new = {col: np.concatenate([old[col][keep], new[col]]) for col in CANDLE_COLUMNS}
+
+        self._write(symbol, digits, new)
+        return added
+
+    @staticmethod
+    def _rescale(values: np.ndarray, digits: int, new_digits: int) -> np.ndarray:
+        if new_digits >= digits:
+            return values * 10 ** (new_digits - digits)
+        return np.rint(values / 10 ** (digits - new_digits)).astype('i8')
+
+    def _write(self, symbol: str, digits: int, columns: dict) -> None:
+        os.makedirs(self._path, exist_ok=True)
+        path = self._file(symbol)
+        # Writing to a temporary file first, so a crash never leaves a broken history behind
+        tmp_path = f'{path}.tmp'
+        data = np.empty((len(CANDLE_COLUMNS), len(columns['ctm']) + 1), dtype='i8')
+        data[:, 0] = digits
+        for i, col in enumerate(CANDLE_COLUMNS):
+            data[i, 1:] = columns[col]
+        with open(tmp_path, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_path, path)
+        self._last_ctm[symbol] = int(columns['ctm'][-1])
+
+    def frame(self, symbol: str) -> pd.DataFrame:
+        """History of the symbol as a DataFrame with decimal prices indexed by the candle start date"""
+        history = self.read(symbol)
+        if history is None:
+            return pd.DataFrame(columns=list(CANDLE_COLUMNS[1:]))
+        digits, columns = history
+        df = pd.DataFrame({col: columns[col] / 10 ** digits if col in PRICE_COLUMNS else columns[col]
+                           for col in CANDLE_COLUMNS[1:]},
+                          index=pd.to_datetime(columns['ctm'], unit='ms'))
+        df.index.name = 'date'
+        return df
@@ -0,0 +1,285 @@
+from typing import Union, Callable
+import itertools
+import queue
+import threading
+import time
+
+from src.config.variables import XTB_PING_SECONDS, XTB_SOCKET_TIMEOUT, XTB_RECONNECT_TRIES
+import src.xtb.xAPIConnector as xtbWrapper
+
+
+def _is_idempotent(command: dict) -> bool:
+    # Commands that only read data can be sent again after a reconnect without side effects
+    name = command.get('command', '')
+    return name == 'ping' or name.startswith('get')
+
+
+class XtbSession:
+    def __init__(self,
+                 user: str,
+                 password: str,
+                 client_factory: Callable = xtbWrapper.APIClient,
+                 ping_seconds: Union[float, None] = XTB_PING_SECONDS,
+                 socket_timeout: Union[float, None] = XTB_SOCKET_TIMEOUT,
+                 reconnect_tries: int = XTB_RECONNECT_TRIES):
+        """
+        One logged-in XTB session of an account, kept alive and reconnected when it drops.
+
+        A background thread pings the session once it was idle for ping_seconds, so the server does not drop it
+        during long jobs. When a command fails or the socket stays silent for socket_timeout seconds, a new
+        connection is opened and logged in with jittered exponential backoff. The failed command is sent once more
+        if it only reads data (get* commands and ping), any other command raises ConnectionError as it may
+        already have been executed.
+
+        :param client_factory: function returning a connected APIClient, APIClient itself by default.
+        :param ping_seconds: idle time after which the session is pinged, None disables the keepalive.
+        :param socket_timeout: seconds to wait for a reply before the socket is considered dead, None waits forever.
+        :param reconnect_tries: number of login attempts after the session dropped.
+        """
+        self.user = user
+        self._password = password
+        self._client_factory = client_factory
+        self._ping_seconds = ping_seconds
+        self._socket_timeout = socket_timeout
+        self._reconnect_tries = reconnect_tries
+        self._client: Union[xtbWrapper.APIClient, None] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._pinger: Union[threading.Thread, None] = None
+        self._last_used = 0.0
+        self.stream_session_id = None
+        self.in_flight = 0
+        self.reconnects = 0
+        self.alive = False
+
+    def connect(self) -> None:
+        self._login()
+        self._stopping.clear()
+        if self._ping_seconds and (self._pinger is None or not self._pinger.is_alive()):
+            self._pinger = threading.Thread(target=self._keepalive, name=f'xtb-ping-{self.user}', daemon=True)
+            self._pinger.start()
+
+    def _login(self) -> None:
+        client = self._client_factory()
+        try:
+            if self._socket_timeout is not None:
+                client.timeout = self._socket_timeout
+            resp = client.execute(xtbWrapper.loginCommand(self.user, self._password))
+        except Exception:
+            client.disconnect()
+            raise
+        if not resp['status']:
+            client.disconnect()
+            raise ConnectionError(f"Could not establish connection with XTB as {self.user}. "
+                                  f"Reason: {resp['errorCode']}")
+        self._client = client
+        self.stream_session_id = resp['streamSessionId']
+        self._last_used = time.monotonic()
+        self.alive = True
+
+    def _drop_client(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+
+    def _reconnect(self) -> None:
+        self._drop_client()
+        error = None
+        for attempt in range(self._reconnect_tries):
+            time.sleep(xtbWrapper.backoffDelay(attempt))
+            if self._stopping.is_set():
+                break
+            try:
+                self._login()
+            except Exception as e:
+                error = e
+                continue
+            self.reconnects += 1
+            print(f'Reconnected to XTB as {self.user}.')
+            return
+        self.alive = False
+        raise ConnectionError(f'Could not reconnect to XTB as {self.user}. Reason: {error}')
+
+    def execute(self, command: dict) -> dict:
+        # One command at a time per session, the replies of a session come back in the order of its commands
+        with self._lock:
+            if self._client is None:
+                raise ConnectionError(f'XTB session of {self.user} is not connected.')
+            try:
+                resp = self._client.execute(command)
+            except Exception as e:
+                if self._stopping.is_set():
+                    raise
+                print(f"XTB session of {self.user} dropped during {command.get('command')}. Reason: {e}. "
+                      f"Reconnecting...")
+                self._reconnect()
+                if not _is_idempotent(command):
+                    raise ConnectionError(f"XTB session of {self.user} was reconnected, {command.get('command')} "
+                                          f"was not sent again as it may have already been executed.")
+                resp = self._client.execute(command)
+            self._last_used = time.monotonic()
+            return resp
+
+    def _keepalive(self) -> None:
+        wait = self._ping_seconds
+        while not self._stopping.wait(wait):
+            if not self.alive:
+                return
+            idle = time.monotonic() - self._last_used
+            if idle < self._ping_seconds:
+                wait = self._ping_seconds - idle
+                continue
+            try:
+                self.execute(xtbWrapper.baseCommand('ping'))
+            except Exception as e:
+                print(f'Could not ping XTB as {self.user}. Reason: {e}')
+            wait = self._ping_seconds
+
+    def close(self) -> None:
+        self.alive = False
+        self._stopping.set()
+        if self._pinger is not None:
+            self._pinger.join()
+            self._pinger = None
+        if self._client is None:
+            return
+        try:
+            with self._lock:
+                self._client.execute(xtbWrapper.baseCommand('logout'))
+        except Exception:
+            pass
+        self._drop_client()
+
+
+class XtbSessionPool:
+    def __init__(self,
+                 accounts: list,
+                 client_factory: Callable = xtbWrapper.APIClient):
+        """
+        Pool of XTB sessions, one per account.
+
+        Every session has its own command rate limit, so independent commands spread over N sessions run
+        roughly N times faster. Commands go to the least loaded session (round-robin among equally loaded ones),
+        a session that fails is taken out of the pool and its command is retried on another session.
+
+        :param accounts: list of (user, password) tuples.
+        """
+        if not accounts:
+            raise ValueError('At least one XTB account has to be passed.')
+
+        self._sessions = [XtbSession(user, password, client_factory) for user, password in accounts]
+        self._lock = threading.Lock()
+        self._next = itertools.count()
+
+    @property
+    def sessions(self) -> list:
+        return self._sessions
+
+    @property
+    def alive_sessions(self) -> list:
+        return [session for session in self._sessions if session.alive]
+
+    @property
+    def stream_session_id(self):
+        alive = self.alive_sessions
+        return alive[0].stream_session_id if alive else None
+
+    def __len__(self) -> int:
+        return len(self.alive_sessions)
+
+    def connect(self) -> None:
+        """Log in with every account, accounts that cannot log in are left out of the pool"""
+        errors = list()
+        for session in self._sessions:
+            try:
+                session.connect()
+            except Exception as e:
+                errors.append(f'{session.user}: {e}')
+                print(f'Could not log in to XTB as {session.user}. Reason: {e}')
+        if not self.alive_sessions:
+            raise ConnectionError(f"Could not establish any XTB session. Reasons: {'; '.join(errors)}")
+
+    def disconnect(self) -> None:
+        for session in self._sessions:
+            session.close()
+
+    def _pick_session(self) -> XtbSession:
+        with self._lock:
+            alive = self.alive_sessions
+            if not alive:
+                raise ConnectionError('All XTB sessions were dropped.')
+            offset = next(self._next)
+            session = min((alive[(offset + i) % len(alive)] for i in range(len(alive))),
+                          key=lambda s: s.in_flight)
+            session.in_flight += 1
+            return session
+
+    def _execute_on(self, session: XtbSession, command: dict) -> dict:
+        try:
+            return session.execute(command)
+        except Exception as e:
+            if not session.alive:
+                print(f'XTB session of {session.user} was dropped. Reason: {e}')
+            raise
+        finally:
+            with self._lock:
+                session.in_flight -= 1
+
+    def execute(self, command: dict) -> dict:
+        """Execute the command on the least loaded session, failing over to the other sessions if it drops"""
+        while True:
+            session = self._pick_session()
+            try:
+                return self._execute_on(session, command)
+            except Exception:
+                if session.alive or not _is_idempotent(command) or not self.alive_sessions:
+                    raise
+
+    def execute_many(self, commands: list) -> list:
+        """
+        Execute independent commands on all sessions at once.
+
+        Every session takes the next waiting command as soon as it is free. The read-only commands of a dropped
+        session are taken over by the remaining ones.
+
+        :param commands: list of (command name, arguments) tuples.
+        :return: list of the responses in the order of the commands. Failed commands are returned as exceptions.
+        """
+        results: list = [None] * len(commands)
+        tasks = queue.Queue()
+        for i, command in enumerate(commands):
+            tasks.put(i)
+
+        def work(session: XtbSession):
+            while session.alive:
+                try:
+                    i = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                command = xtbWrapper.baseCommand(*commands[i])
+                with self._lock:
+                    session.in_flight += 1
+                try:
+                    results[i] = self._execute_on(session, command)
+                except Exception as e:
+                    if session.alive or not _is_idempotent(command):
+                        results[i] = e
+                        continue
+                    # The command goes back to the queue for the sessions that are still alive
+                    tasks.put(i)
+                    return
+
+        # Commands put back by a dropped session after the others had finished need another round
+        while not tasks.empty() and self.alive_sessions:
+            threads = [threading.Thread(target=work, args=(session,), daemon=True) for session in self.alive_sessions]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        while not tasks.empty():
+            results[tasks.get_nowait()] = ConnectionError('All XTB sessions were dropped.')
+        return results
@@ -0,0 +1,190 @@
+from typing import Union
+import os
+import re
+import time
+import numpy as np
+
+from src.config.variables import XTB_CATALOG_PATH, XTB_CATALOG_MAX_AGE
+
+# 'AAPL.US_9' -> ticker 'AAPL', country 'US'
+_SYMBOL_RE = re.compile(r'^(?P<ticker>[^.]*)(?:\.(?P<country>[^._]*))?')
+_BRACKETS_RE = re.compile(r'\([^)]*\)')
+
+
+class CatalogDiff:
+    def __init__(self, added: list, removed: list, changed: list):
+        """Symbols added, removed and changed by a refresh of the SymbolCatalog"""
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self) -> str:
+        return f'CatalogDiff({len(self.added)} added, {len(self.removed)} removed, {len(self.changed)} changed)'
+
+
+class SymbolCatalog:
+    COLUMNS = ('symbol', 'ticker', 'country', 'category', 'name', 'description', 'cfd')
+
+    def __init__(self,
+                 path: Union[str, None] = XTB_CATALOG_PATH,
+                 max_age: float = XTB_CATALOG_MAX_AGE):
+        """
+        Compact catalog of the XTB symbols.
+
+        The parsed getAllSymbols reply is kept as NumPy columns (symbol, ticker, country, category, name,
+        description and the CFD flag) indexed by category and country, and stored on disk in one .npz file,
+        so it is reloaded in milliseconds instead of querying the largest payload of the API every time.
+
+        :param path: path of the snapshot file, None keeps the catalog in memory only.
+        :param max_age: number of seconds after which the snapshot should be refreshed, see fresh.
+        """
+        self._path = path
+        self._max_age = max_age
+        self._columns: Union[dict, None] = None
+        self._created_at: Union[float, None] = None
+        self._by_category: dict = dict()
+        self._by_country: dict = dict()
+
+        if path is not None and os.path.exists(path):
+            try:
+                self.load()
+            except Exception as e:
+                # A broken or outdated snapshot is treated as missing, so the catalog gets refreshed
+                print(f'Could not load the XTB symbol catalog from {path}. Reason: {e}')
+
+    @property
+    def loaded(self) -> bool:
+        return self._columns is not None
+
+    @property
+    def created_at(self) -> Union[float, None]:
+        return self._created_at
+
+    @property
+    def fresh(self) -> bool:
+        return self.loaded and time.time() - self._created_at < self._max_age
+
+    @property
+    def categories(self) -> list:
+        return list(self._by_category)
+
+    @property
+    def countries(self) -> list:
+        return list(self._by_country)
+
+    def __len__(self) -> int:
+        return len(self._columns['symbol']) if self.loaded else 0
+
+    def load(self) -> None:
+        with np.load(self._path, allow_pickle=False) as snapshot:
+            columns = {col: snapshot[col] for col in self.COLUMNS}
+            created_at = float(snapshot['created_at'])
+        self._set_columns(columns, created_at)
+
+    def save(self) -> None:
+        if self._path is None or not self.loaded:
+            return
+        if os.path.dirname(self._path):
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        # Writing to a temporary file first, so a crash never leaves a broken snapshot behind
+        tmp_path = f'{self._path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, created_at=np.array(self._created_at), **self._columns)
+        os.replace(tmp_path, self._path)
+
+    def _set_columns(self, columns: dict, created_at: float) -> None:
+        self._columns = columns
+        self._created_at = created_at
+        self._by_category = self._index(columns['category'])
+        self._by_country = self._index(columns['country'])
+
+    @staticmethod
+    def _index(values: np.ndarray) -> dict:
+        keys, inverse = np.unique(values, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.cumsum(np.bincount(inverse, minlength=len(keys)))[:-1]
+        return {str(key): rows for key, rows in zip(keys, np.split(order, bounds))}
+
+    @classmethod
+    def parse(cls, raw_data: list) -> dict:
+        """Parse the getAllSymbols returnData into the catalog columns in a single pass"""
+        columns = {col: list() for col in cls.COLUMNS}
+        for elem in raw_data:
+            symbol, description = elem['symbol'], elem.get('description') or ''
+            match = _SYMBOL_RE.match(symbol)
+            columns['symbol'].append(symbol)
+            columns['ticker'].append(match.group('ticker'))
+            columns['country'].append(match.group('country') or '')
+            columns['category'].append(elem.get('categoryName') or '')
+            columns['name'].append(_BRACKETS_RE.sub('', description).strip())
+            columns['description'].append(description)
+            columns['cfd'].append('CFD' in description)
+        return {col: np.array(values, dtype=bool if col == 'cfd' else str) for col, values in columns.items()}
+
+    def refresh(self, raw_data: list) -> CatalogDiff:
+        """
+        Replace the catalog with a new getAllSymbols reply and store it on disk.
+
+        :return: CatalogDiff with the symbols added, removed or changed since the previous snapshot.
+        """
+        new = self.parse(raw_data)
+        old = self._columns if self.loaded else {col: new[col][:0] for col in self.COLUMNS}
+
+        common, old_idx, new_idx = np.intersect1d(old['symbol'], new['symbol'], return_indices=True)
+        changed = np.zeros(len(common), dtype=bool)
+        for col in self.COLUMNS[1:]:
+            changed |= old[col][old_idx] != new[col][new_idx]
+        diff = CatalogDiff(added=np.setdiff1d(new['symbol'], old['symbol']).tolist(),
+                           removed=np.setdiff1d(old['symbol'], new['symbol']).tolist(),
+                           changed=common[changed].tolist())
+
+        self._set_columns(new, time.time())
+        self.save()
+        return diff
+
+    def select(self, category: Union[str, None] = None, include_cfd: bool = False) -> np.ndarray:
+        """Row indices of the catalog in the passed category, CFDs are left out unless include_cfd is True"""
+        if category is not None:
+            if category not in self._by_category:
+                raise ValueError(f"Error, {', '.join(self._by_category)} are valid categories. {category} passed.")
+            rows = self._by_category[category]
+        else:
+            rows = np.arange(len(self))
+        if not include_cfd:
+            rows = rows[~self._columns['cfd'][rows]]
+        return rows
+
+    def symbols(self,
+                category: Union[str, None] = None,
+                include_cfd: bool = False,
+                group_by_country: bool = True) -> Union[dict, list]:
+        """
+        Tickers of the catalog.
+
+        :return: Python dict {country: [unique tickers]} if group_by_country, otherwise a list of
+        {'symbol': ticker, 'country': country} dicts.
+        """
+        rows = self.select(category, include_cfd)
+        tickers, countries = self._columns['ticker'][rows].tolist(), self._columns['country'][rows].tolist()
+        if not group_by_country:
+            return [{'symbol': ticker, 'country': country} for ticker, country in zip(tickers, countries)]
+
+        grouped = dict()
+        for ticker, country in zip(tickers, countries):
+            grouped.setdefault(country, dict())[ticker] = None
+        return {country: list(comps) for country, comps in grouped.items()}
+
+    def xtb_symbols(self, category: Union[str, None] = None, include_cfd: bool = False) -> list:
+        """Full XTB symbols of the catalog (e.g. 'AAPL.US_9'), as expected by the symbol arguments of the API"""
+        return self._columns['symbol'][self.select(category, include_cfd)].tolist()
+
+    def names(self, category: Union[str, None] = None) -> list:
+        """List of {'symbol': ticker, 'country': country, 'name': company name} dicts without CFDs"""
+        rows = self.select(category)
+        return [{'symbol': ticker, 'country': country, 'name': name}
+                for ticker, country, name in zip(self._columns['ticker'][rows].tolist(),
+                                                 self._columns['country'][rows].tolist(),
+                                                 self._columns['name'][rows].tolist())]
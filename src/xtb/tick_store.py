@@ -0,0 +1,163 @@
+from typing import Union
+import threading
+import numpy as np
+
+from src.config.variables import XTB_TICK_STORE_CAPACITY
+
+TICK_DTYPE = np.dtype([('timestamp', 'i8'),
+                       ('bid', 'f8'),
+                       ('ask', 'f8'),
+                       ('bidVolume', 'f8'),
+                       ('askVolume', 'f8')])
+
+
+class _TickBuffer:
+    """
+    Mirrored ring buffer of one symbol.
+
+    Every tick is written twice, at pos and pos + capacity, so the last n ticks always lie in one contiguous
+    slice of the 2 * capacity array and can be returned as a view without copying.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity, dtype=TICK_DTYPE)
+        self.pos = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, tick: tuple) -> None:
+        with self.lock:
+            self.data[self.pos] = tick
+            self.data[self.pos + self.capacity] = tick
+            self.pos = (self.pos + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def last(self, n: int) -> np.ndarray:
+        with self.lock:
+            n = min(n, self.count)
+            end = self.pos + self.capacity
+            view = self.data[end - n:end]
+        view.flags.writeable = False
+        return view
+
+
+class TickStore:
+    def __init__(self, capacity: int = XTB_TICK_STORE_CAPACITY):
+        """
+        In-memory store of the streamed tick prices.
+
+        Every symbol gets a preallocated NumPy ring buffer of the last capacity ticks (timestamp, bid, ask,
+        bid and ask volumes), only the best price level (level 0) is kept. Appending a tick does not allocate.
+        Reads return read-only views into the buffer: they are valid until the ticks are overwritten,
+        i.e. for the next capacity - n ticks of the symbol, copy them to keep them longer.
+
+        Example:
+        store = TickStore()
+        client = APIStreamClient(ssId=ssid, tickStore=store)
+        client.subscribePrices(['EURUSD', 'EURPLN'])
+        store.latest('EURUSD'), store.last('EURUSD', 100), store.vwap('EURUSD', window_ms=60000)
+        """
+        if capacity < 1:
+            raise ValueError(f'Capacity has to be at least 1. {capacity} passed.')
+
+        self._capacity = capacity
+        self._buffers: dict = dict()
+        self._latest: dict = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def symbols(self) -> list:
+        return list(self._buffers)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._buffers
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def reserve(self, symbols: list) -> None:
+        """Preallocate the buffers of the passed symbols, e.g. when subscribing to them"""
+        for symbol in symbols:
+            self._get_buffer(symbol)
+
+    def _get_buffer(self, symbol: str) -> _TickBuffer:
+        buffer = self._buffers.get(symbol)
+        if buffer is None:
+            with self._lock:
+                buffer = self._buffers.setdefault(symbol, _TickBuffer(self._capacity))
+        return buffer
+
+    def on_tick(self, msg: dict) -> None:
+        """Store a tickPrices message of APIStreamClient, can be passed as its tickFun"""
+        data = msg['data']
+        if data.get('level', 0) != 0:
+            return
+        self.append(data['symbol'], data['timestamp'], data['bid'], data['ask'],
+                    data.get('bidVolume') or 0, data.get('askVolume') or 0)
+
+    def append(self,
+               symbol: str,
+               timestamp: int,
+               bid: float,
+               ask: float,
+               bid_volume: float = 0,
+               ask_volume: float = 0) -> None:
+        tick = (timestamp, bid, ask, bid_volume, ask_volume)
+        self._get_buffer(symbol).append(tick)
+        self._latest[symbol] = tick
+
+    def latest(self, symbol: str) -> Union[dict, None]:
+        """Latest quote of the symbol as a dict with the TICK_DTYPE fields, None if no tick arrived yet"""
+        tick = self._latest.get(symbol)
+        return dict(zip(TICK_DTYPE.names, tick)) if tick is not None else None
+
+    def count(self, symbol: str) -> int:
+        """Number of ticks of the symbol currently held in the store"""
+        buffer = self._buffers.get(symbol)
+        return buffer.count if buffer is not None else 0
+
+    def last(self, symbol: str, n: Union[int, None] = None) -> np.ndarray:
+        """
+        Get the last n ticks of the symbol, all stored ticks if n is None.
+
+        :return: read-only structured array view with the TICK_DTYPE fields, oldest tick first.
+        """
+        buffer = self._buffers.get(symbol)
+        if buffer is None:
+            return np.zeros(0, dtype=TICK_DTYPE)
+        return buffer.last(n if n is not None else buffer.capacity)
+
+    def window(self, symbol: str, window_ms: int, now: Union[int, None] = None) -> np.ndarray:
+        """
+        Get the ticks of the symbol of the last window_ms milliseconds.
+
+        :param now: end of the window as an XTB timestamp (ms), defaults to the timestamp of the latest tick.
+        :return: read-only structured array view, oldest tick first.
+        """
+        ticks = self.last(symbol)
+        if not len(ticks):
+            return ticks
+        now = now if now is not None else ticks['timestamp'][-1]
+        start = np.searchsorted(ticks['timestamp'], now - window_ms, side='left')
+        return ticks[start:]
+
+    def vwap(self,
+             symbol: str,
+             n: Union[int, None] = None,
+             window_ms: Union[int, None] = None) -> float:
+        """
+        Volume weighted average of the mid price over the last n ticks or the last window_ms milliseconds.
+
+        The mid price of every tick is weighted by its bid plus ask volume. Returns NaN if there are no ticks
+        or no volume in the window.
+        """
+        ticks = self.window(symbol, window_ms) if window_ms is not None else self.last(symbol, n)
+        volume = ticks['bidVolume'] + ticks['askVolume']
+        total = volume.sum()
+        if not len(ticks) or not total:
+            return float('nan')
+        return float(((ticks['bid'] + ticks['ask']) / 2 * volume).sum() / total)
@@ -0,0 +1,173 @@
+import asyncio
+import itertools
+import json
+import logging
+import ssl
+import time
+
+from src.xtb.xAPIConnector import DEFAULT_XAPI_ADDRESS, DEFAULT_XAPI_PORT, API_SEND_TIMEOUT, API_MAX_CONN_TRIES, \
+    API_MESSAGE_TERMINATOR, backoffDelay, baseCommand, loginCommand
+
+# maximum size of a single API message (in bytes), getAllSymbols responses take several megabytes
+API_MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+logger = logging.getLogger("jsonSocket")
+
+
+class AsyncAPIClient(object):
+    def __init__(self, address=DEFAULT_XAPI_ADDRESS, port=DEFAULT_XAPI_PORT, encrypt=True):
+        """
+        asyncio counterpart of APIClient supporting request pipelining.
+
+        Every command gets a unique customTag, the commands are sent without waiting for the previous replies
+        (still keeping the API_SEND_TIMEOUT gap between them) and the replies are matched to their commands
+        by the customTag echoed by the API, so many requests can be in flight on one session.
+
+        Example:
+        async with AsyncAPIClient() as client:
+            await client.login(userId, password)
+            symbols = await asyncio.gather(*[client.commandExecute('getSymbol', dict(symbol=s)) for s in names])
+        """
+        self._address = address
+        self._port = port
+        self._ssl = encrypt
+        self._reader = None
+        self._writer = None
+        self._readerTask = None
+        self._readError = None
+        self._pending = dict()
+        self._tags = itertools.count(1)
+        self._sendLock = None
+        self._lastSent = 0.0
+        self._streamSessionId = None
+
+    @property
+    def address(self):
+        return self._address
+
+    @property
+    def port(self):
+        return self._port
+
+    @property
+    def encrypt(self):
+        return self._ssl
+
+    @property
+    def streamSessionId(self):
+        return self._streamSessionId
+
+    @property
+    def connected(self):
+        # The socket is of no use once the reader stopped, as nothing would resolve the replies
+        return self._writer is not None and not self._writer.is_closing() \
+            and self._readerTask is not None and not self._readerTask.done()
+
+    async def connect(self):
+        sslContext = ssl.create_default_context() if self._ssl else None
+        for i in range(API_MAX_CONN_TRIES):
+            try:
+                self._reader, self._writer = await asyncio.open_connection(
+                    self._address, self._port, ssl=sslContext, limit=API_MAX_MESSAGE_SIZE)
+            except OSError as msg:
+                logger.error("SockThread Error: %s", msg)
+                if i < API_MAX_CONN_TRIES - 1:
+                    await asyncio.sleep(backoffDelay(i))
+                continue
+            logger.info("Socket connected")
+            self._sendLock = asyncio.Lock()
+            self._readError = None
+            self._readerTask = asyncio.ensure_future(self._readResponses())
+            return True
+        raise ConnectionError("Cannot connect to " + self._address + ":" + str(self._port) + " after "
+                              + str(API_MAX_CONN_TRIES) + " retries")
+
+    async def _send(self, msg):
+        async with self._sendLock:
+            wait = self._lastSent + API_SEND_TIMEOUT / 1000 - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._writer.write(msg)
+            await self._writer.drain()
+            self._lastSent = time.monotonic()
+        logger.debug('Sent: %s', msg)
+
+    async def _readResponses(self):
+        try:
+            while True:
+                msg = await self._reader.readuntil(API_MESSAGE_TERMINATOR)
+                resp = json.loads(msg[:-len(API_MESSAGE_TERMINATOR)])
+                logger.debug('Received: %s', resp)
+                tag = resp.get('customTag')
+                if tag not in self._pending:
+                    # With many commands in flight there is no telling which one an untagged reply belongs to
+                    logger.error("Dropped a response without a known customTag: %s", resp)
+                    continue
+                future = self._pending.pop(tag)
+                if not future.done():
+                    future.set_result(resp)
+        except asyncio.CancelledError:
+            self._failPending(ConnectionError('client disconnected'))
+            raise
+        except asyncio.IncompleteReadError:
+            self._failPending(ConnectionError('socket connection broken'))
+        except Exception as e:
+            logger.error("Reading the responses failed: %s", e)
+            self._failPending(e)
+
+    def _failPending(self, error):
+        self._readError = error
+        pending, self._pending = self._pending, dict()
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def execute(self, dictionary):
+        if not self.connected:
+            raise ConnectionError("socket connection broken" + (f": {self._readError}" if self._readError else ""))
+        tag = str(next(self._tags))
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tag] = future
+        try:
+            await self._send(json.dumps(dict(dictionary, customTag=tag)).encode('utf-8'))
+        except Exception:
+            self._pending.pop(tag, None)
+            raise
+        resp = await future
+        resp.pop('customTag', None)
+        return resp
+
+    async def commandExecute(self, commandName, arguments=None):
+        return await self.execute(baseCommand(commandName, arguments))
+
+    async def login(self, userId, password, appName=''):
+        resp = await self.execute(loginCommand(userId=userId, password=password, appName=appName))
+        if resp.get('status'):
+            self._streamSessionId = resp.get('streamSessionId')
+        return resp
+
+    async def logout(self):
+        return await self.commandExecute('logout')
+
+    async def disconnect(self):
+        if self._readerTask is not None:
+            self._readerTask.cancel()
+            try:
+                await self._readerTask
+            except asyncio.CancelledError:
+                pass
+            self._readerTask = None
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._writer = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.disconnect()
@@ -2,8 +2,10 @@ import json
 import socket
 import logging
 import time
+import random
 import ssl
-from threading import Thread
+import queue
+from threading import Thread, Lock
 
 # set to true on debug environment only
 DEBUG = False
@@ -17,11 +19,17 @@ DEFUALT_XAPI_STREAMING_PORT = 5113
 WRAPPER_NAME    = 'python'
 WRAPPER_VERSION = '2.5.0'
 
-# API inter-command timeout (in ms)
-API_SEND_TIMEOUT = 100
+# API inter-command timeout (in ms), minimum gap between two commands sent over one connection
+API_SEND_TIMEOUT = 200
 
-# max connection tries
+# size of a single socket read (in bytes) and the terminator of every API message
+API_RECV_SIZE = 65536
+API_MESSAGE_TERMINATOR = b'\n\n'
+
+# max connection tries and the delays (in s) between them, the delay doubles with every try up to the maximum
 API_MAX_CONN_TRIES = 3
+API_CONN_BACKOFF_BASE = 0.25
+API_CONN_BACKOFF_MAX = 30.0
 
 # logger properties
 logger = logging.getLogger("jsonSocket")
@@ -60,8 +68,13 @@ class JsonSocket(object):
         self._timeout = None
         self._address = address
         self._port = port
-        self._decoder = json.JSONDecoder()
-        self._receivedData = ''
+        self._receivedData = bytearray()
+        self._scanned = 0
+        self._sendLock = Lock()
+        self._lastSent = 0.0
+        self._queueLock = Lock()
+        self._sendQueue = None
+        self._sender = None
 
     def connect(self):
         for i in range(API_MAX_CONN_TRIES):
@@ -69,7 +82,8 @@ class JsonSocket(object):
                 self.socket.connect( (self.address, self.port) )
             except socket.error as msg:
                 logger.error("SockThread Error: %s" % msg)
-                time.sleep(0.25);
+                if i < API_MAX_CONN_TRIES - 1:
+                    time.sleep(backoffDelay(i))
                 continue
             logger.info("Socket connected")
             return True
@@ -79,32 +93,69 @@ class JsonSocket(object):
         msg = json.dumps(obj)
         self._waitingSend(msg)
 
+    def _queueObj(self, obj):
+        # Non-blocking send, the command is sent by the sender thread as soon as the inter-command gap allows
+        with self._queueLock:
+            if self._sender is None:
+                self._sendQueue = queue.Queue()
+                self._sender = Thread(target=self._sendQueued, args=(), daemon=True)
+                self._sender.start()
+        self._sendQueue.put(obj)
+
+    def _sendQueued(self):
+        while True:
+            obj = self._sendQueue.get()
+            try:
+                if obj is None:
+                    return
+                self._sendObj(obj)
+            except Exception as e:
+                logger.error("Could not send %s: %s", obj, e)
+            finally:
+                self._sendQueue.task_done()
+
+    def _stopSender(self):
+        # Sends the commands still in the queue before the sender thread stops
+        with self._queueLock:
+            sender, self._sender = self._sender, None
+        if sender is not None:
+            self._sendQueue.put(None)
+            sender.join()
+
     def _waitingSend(self, msg):
         if self.socket:
-            sent = 0
             msg = msg.encode('utf-8')
-            while sent < len(msg):
-                sent += self.conn.send(msg[sent:])
-                logger.info('Sent: ' + str(msg))
-                time.sleep(API_SEND_TIMEOUT/1000)
-
-    def _read(self, bytesSize=4096):
+            with self._sendLock:
+                # Waiting only for the rest of the gap since the last command instead of sleeping after every send
+                wait = self._lastSent + API_SEND_TIMEOUT / 1000 - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                self.conn.sendall(msg)
+                self._lastSent = time.monotonic()
+            logger.debug('Sent: %s', msg)
+
+    def _read(self, bytesSize=API_RECV_SIZE):
         if not self.socket:
             raise RuntimeError("socket connection broken")
         while True:
-            char = self.conn.recv(bytesSize).decode()
-            self._receivedData += char
-            try:
-                (resp, size) = self._decoder.raw_decode(self._receivedData)
-                if size == len(self._receivedData):
-                    self._receivedData = ''
-                    break
-                elif size < len(self._receivedData):
-                    self._receivedData = self._receivedData[size:].strip()
-                    break
-            except ValueError as e:
-                continue
-        logger.info('Received: ' + str(resp))
+            # Only the bytes that arrived since the last scan are searched for the message terminator
+            end = self._receivedData.find(API_MESSAGE_TERMINATOR, self._scanned)
+            if end >= 0:
+                try:
+                    resp = json.loads(self._receivedData[:end])
+                except ValueError:
+                    # The terminator is part of an unfinished message, keep on reading
+                    self._scanned = end + len(API_MESSAGE_TERMINATOR)
+                    continue
+                del self._receivedData[:end + len(API_MESSAGE_TERMINATOR)]
+                self._scanned = 0
+                break
+            self._scanned = max(len(self._receivedData) - len(API_MESSAGE_TERMINATOR) + 1, 0)
+            chunk = self.conn.recv(bytesSize)
+            if not chunk:
+                raise RuntimeError("socket connection broken")
+            self._receivedData += chunk
+        logger.debug('Received: %s', resp)
         return resp
 
     def _readObj(self):
@@ -112,6 +163,7 @@ class JsonSocket(object):
         return msg
 
     def close(self):
+        self._stopSender()
         logger.debug("Closing socket")
         self._closeSocket()
         if self.socket is not self.conn:
@@ -173,9 +225,12 @@ class APIClient(JsonSocket):
 
 class APIStreamClient(JsonSocket):
     def __init__(self, address=DEFAULT_XAPI_ADDRESS, port=DEFUALT_XAPI_STREAMING_PORT, encrypt=True, ssId=None, 
-                 tickFun=None, tradeFun=None, balanceFun=None, tradeStatusFun=None, profitFun=None, newsFun=None):
+                 tickFun=None, tradeFun=None, balanceFun=None, tradeStatusFun=None, profitFun=None, newsFun=None,
+                 tickStore=None):
         super(APIStreamClient, self).__init__(address, port, encrypt)
         self._ssId = ssId
+        # optional TickStore keeping the streamed prices of subscribePrices
+        self._tickStore = tickStore
 
         self._tickFun = tickFun
         self._tradeFun = tradeFun
@@ -195,9 +250,12 @@ class APIStreamClient(JsonSocket):
     def _readStream(self):
         while (self._running):
                 msg = self._readObj()
-                logger.info("Stream received: " + str(msg))
+                logger.debug("Stream received: %s", msg)
                 if (msg["command"]=='tickPrices'):
-                    self._tickFun(msg)
+                    if self._tickStore is not None:
+                        self._tickStore.on_tick(msg)
+                    if self._tickFun is not None:
+                        self._tickFun(msg)
                 elif (msg["command"]=='trade'):
                     self._tradeFun(msg)
                 elif (msg["command"]=="balance"):
@@ -215,12 +273,14 @@ class APIStreamClient(JsonSocket):
         self.close()
 
     def execute(self, dictionary):
-        self._sendObj(dictionary)
+        self._queueObj(dictionary)
 
     def subscribePrice(self, symbol):
         self.execute(dict(command='getTickPrices', symbol=symbol, streamSessionId=self._ssId))
         
     def subscribePrices(self, symbols):
+        if self._tickStore is not None:
+            self._tickStore.reserve(symbols)
         for symbolX in symbols:
             self.subscribePrice(symbolX)
     
@@ -263,6 +323,11 @@ class APIStreamClient(JsonSocket):
         self.execute(dict(command='stopNews', streamSessionId=self._ssId))
 
 
+def backoffDelay(attempt, base=API_CONN_BACKOFF_BASE, maximum=API_CONN_BACKOFF_MAX):
+    # exponential backoff with full jitter, so clients dropped at the same time do not reconnect all at once
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
 # Command templates
 def baseCommand(commandName, arguments=None):
     if arguments==None:
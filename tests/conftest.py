@@ -7,4 +7,12 @@
     - https://docs.pytest.org/en/stable/writing_plugins.html
 """
 
-# import pytest
+import os
+import sys
+import tempfile
+
+# The configuration is read on import, so the tests run against a throwaway SQLite database
+os.environ.setdefault('PRIMARY_USERNAME', 'test')
+os.environ.setdefault('STOCK_ANALYSER_DATABASE_URL',
+                      f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stockanalyser.sqlite')}")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,28 @@
+from datetime import date
+import pandas as pd
+from sqlalchemy import create_engine, inspect
+
+from src.database.context import DbContext
+from src.database.models.balance_sheet import BalanceSheet
+from src.loader.db_loader import DbLoader
+
+
+def test_upsert_statements_upgrades_old_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.sqlite'}")
+    # Balance sheet table of an older model, without the later columns and indexes
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f'CREATE TABLE {BalanceSheet.__tablename__} (ticker VARCHAR, country VARCHAR, '
+                             f'asof_date DATE, "totalAssets" BIGINT, PRIMARY KEY (ticker, country, asof_date))')
+    loader = DbLoader(db_context=DbContext(engine))
+    data = pd.DataFrame([dict(ticker='ABC', country='US', asof_date=date(2023, 12, 31), totalAssets=100,
+                              retainedEarnings=40)])
+
+    assert loader.upsert_statements({'balance': data}) == {'balance': {'inserted': 1, 'updated': 0, 'unchanged': 0}}
+    assert loader.upsert_statements({'balance': data}) == {'balance': {'inserted': 0, 'updated': 0, 'unchanged': 1}}
+
+    columns = {col['name'] for col in inspect(engine).get_columns(BalanceSheet.__tablename__)}
+    assert columns == {col.name for col in BalanceSheet.__table__.columns}
+    indexes = {index['name'] for index in inspect(engine).get_indexes(BalanceSheet.__tablename__)}
+    assert f'ix_{BalanceSheet.__tablename__}_ticker_country' in indexes
+    stored = pd.read_sql_table(BalanceSheet.__tablename__, engine)
+    assert stored[['totalAssets', 'retainedEarnings']].values.tolist() == [[100, 40]]
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from src.xtb.ohlcv_store import OhlcvStore
+
+DAY = 86400 * 1000
+
+
+def rate_infos(digits: int, candles: list) -> dict:
+    """returnData of getChartRangeRequest, candles are (ctm, open, high, low, close, vol) with decimal prices"""
+    scale = 10 ** digits
+    return {'digits': digits,
+            'rateInfos': [{'ctm': ctm, 'open': open_ * scale, 'high': (high - open_) * scale,
+                           'low': (low - open_) * scale, 'close': (close - open_) * scale, 'vol': vol}
+                          for ctm, open_, high, low, close, vol in candles]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OhlcvStore(str(tmp_path))
+
+
+def test_parse_decodes_shifts_from_open():
+    digits, columns = OhlcvStore.parse(rate_infos(2, [(0, 10.5, 11.25, 10.0, 10.75, 120.4),
+                                                      (DAY, 10.75, 10.8, 9.5, 9.99, 80.6)]))
+
+    assert digits == 2
+    assert columns['ctm'].tolist() == [0, DAY]
+    assert columns['open'].tolist() == [1050, 1075]
+    assert columns['high'].tolist() == [1125, 1080]
+    assert columns['low'].tolist() == [1000, 950]
+    assert columns['close'].tolist() == [1075, 999]
+    assert columns['vol'].tolist() == [120, 81]
+    assert all(values.dtype == np.int64 for values in columns.values())
+
+
+def test_append_replaces_overlapping_candles(store):
+    assert store.append('AAPL.US_9', rate_infos(2, [(0, 10, 11, 9, 10.5, 100),
+                                                    (DAY, 10.5, 12, 10, 11, 200)])) == 2
+    # The last candle of the previous fetch was still open and comes again with its final prices
+    assert store.append('AAPL.US_9', rate_infos(2, [(DAY, 10.5, 12.5, 10, 12, 250),
+                                                    (2 * DAY, 12, 13, 11.5, 12.5, 300)])) == 1
+
+    digits, columns = store.read('AAPL.US_9')
+    assert digits == 2
+    assert columns['ctm'].tolist() == [0, DAY, 2 * DAY]
+    assert columns['close'].tolist() == [1050, 1200, 1250]
+    assert columns['vol'].tolist() == [100, 250, 300]
+    assert store.last_ctm('AAPL.US_9') == 2 * DAY
+
+
+def test_append_rescales_on_digits_change(store):
+    store.append('EURUSD', rate_infos(4, [(0, 1.1234, 1.13, 1.12, 1.125, 10)]))
+    store.append('EURUSD', rate_infos(5, [(DAY, 1.12501, 1.13002, 1.12, 1.12999, 20)]))
+
+    digits, columns = store.read('EURUSD')
+    assert digits == 5
+    assert columns['open'].tolist() == [112340, 112501]
+    assert columns['close'].tolist() == [112500, 112999]
+
+    store.append('EURUSD', rate_infos(3, [(2 * DAY, 1.125, 1.131, 1.12, 1.13, 30)]))
+    digits, columns = store.read('EURUSD')
+    assert digits == 3
+    # Dropping digits rounds the stored prices
+    assert columns['open'].tolist() == [1123, 1125, 1125]
+
+
+def test_rescale():
+    values = np.array([112345, -112355], dtype='i8')
+
+    assert OhlcvStore._rescale(values, 5, 7).tolist() == [11234500, -11235500]
+    assert OhlcvStore._rescale(values, 5, 3).tolist() == [1123, -1124]
+    assert OhlcvStore._rescale(values, 5, 5).tolist() == values.tolist()
+
+
+def test_frame_round_trip(store):
+    store.append('EUR/USD', rate_infos(5, [(0, 1.12345, 1.13, 1.12, 1.125, 10),
+                                           (DAY, 1.125, 1.13, 1.12, 1.12999, 20)]))
+
+    assert store.symbols == ['EUR/USD']
+    assert 'EUR/USD' in store
+    df = store.frame('EUR/USD')
+    assert df.index.strftime('%Y-%m-%d').tolist() == ['1970-01-01', '1970-01-02']
+    assert df['open'].tolist() == pytest.approx([1.12345, 1.125])
+    assert df['close'].tolist() == pytest.approx([1.125, 1.12999])
+    assert list(store.read_many()) == ['EUR/USD']
@@ -0,0 +1,153 @@
+from collections import Counter
+import time
+import pytest
+
+import src.xtb.xAPIConnector as xtbWrapper
+from src.xtb.session_pool import XtbSession, XtbSessionPool
+
+
+class FakeBroker:
+    """Server side of the fake XTB clients, the tests decide when a session drops and whether it can log in again"""
+    def __init__(self):
+        self.executed = list()
+        self.logins = Counter()
+        # user: number of commands served before the connection drops
+        self.drop_after = dict()
+        self.refused = set()
+        # seconds every command takes, so the sessions of a pool take turns
+        self.delay = 0
+
+    def client(self):
+        return FakeClient(self)
+
+
+class FakeClient:
+    def __init__(self, broker: FakeBroker):
+        self._broker = broker
+        self.user = None
+        self.timeout = None
+
+    def execute(self, command: dict) -> dict:
+        name = command['command']
+        if name == 'login':
+            user = command['arguments']['userId']
+            if user in self._broker.refused:
+                return {'status': False, 'errorCode': 'BE005'}
+            self.user = user
+            self._broker.logins[user] += 1
+            return {'status': True, 'streamSessionId': f'stream-{user}'}
+
+        left = self._broker.drop_after.get(self.user)
+        if left is not None:
+            if left <= 0:
+                raise ConnectionResetError('Connection reset by peer')
+            self._broker.drop_after[self.user] = left - 1
+        time.sleep(self._broker.delay)
+        self._broker.executed.append((self.user, name))
+        return {'status': True, 'returnData': {'command': name, 'arguments': command['arguments'], 'user': self.user}}
+
+    def disconnect(self) -> None:
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(xtbWrapper, 'backoffDelay', lambda attempt: 0)
+
+
+def heal_on_reconnect(monkeypatch, broker: FakeBroker, user: str) -> None:
+    # The connection of the user works again once the session reconnects
+    def backoff_delay(attempt):
+        broker.drop_after.pop(user, None)
+        return 0
+    monkeypatch.setattr(xtbWrapper, 'backoffDelay', backoff_delay)
+
+
+@pytest.fixture
+def broker():
+    return FakeBroker()
+
+
+@pytest.fixture
+def pool(broker):
+    pool = XtbSessionPool([('alice', 'secret'), ('bob', 'secret')], client_factory=broker.client)
+    pool.connect()
+    yield pool
+    pool.disconnect()
+
+
+def test_read_commands_are_replayed_after_reconnect(monkeypatch, broker):
+    session = XtbSession('alice', 'secret', client_factory=broker.client, ping_seconds=None)
+    session.connect()
+    broker.drop_after['alice'] = 0
+    heal_on_reconnect(monkeypatch, broker, 'alice')
+
+    resp = session.execute(xtbWrapper.baseCommand('getVersion'))
+
+    assert resp['returnData']['command'] == 'getVersion'
+    assert session.reconnects == 1
+    assert broker.logins['alice'] == 2
+    session.close()
+
+
+def test_other_commands_are_not_replayed_after_reconnect(monkeypatch, broker):
+    session = XtbSession('alice', 'secret', client_factory=broker.client, ping_seconds=None)
+    session.connect()
+    broker.drop_after['alice'] = 0
+    heal_on_reconnect(monkeypatch, broker, 'alice')
+
+    with pytest.raises(ConnectionError, match='was not sent again'):
+        session.execute(xtbWrapper.baseCommand('tradeTransaction', {'tradeTransInfo': {'symbol': 'EURUSD'}}))
+
+    assert session.alive
+    assert session.reconnects == 1
+    assert ('alice', 'tradeTransaction') not in broker.executed
+    session.close()
+
+
+def test_execute_fails_over_to_other_session(pool, broker):
+    broker.drop_after['alice'] = 0
+    broker.refused.add('alice')
+
+    users = [pool.execute(xtbWrapper.baseCommand('getVersion'))['returnData']['user'] for _ in range(4)]
+
+    assert users == ['bob'] * 4
+    assert [session.user for session in pool.alive_sessions] == ['bob']
+    assert pool.stream_session_id == 'stream-bob'
+
+
+def test_execute_does_not_fail_over_other_commands(pool, broker):
+    broker.drop_after['alice'] = 0
+    broker.drop_after['bob'] = 0
+    broker.refused.update({'alice', 'bob'})
+
+    with pytest.raises(ConnectionError):
+        pool.execute(xtbWrapper.baseCommand('tradeTransaction'))
+
+    # The failed session is dropped, but the command is not sent to the other one
+    assert len(pool) == 1
+    assert not broker.executed
+
+
+def test_execute_many_after_session_drops(pool, broker):
+    broker.drop_after['alice'] = 2
+    broker.refused.add('alice')
+    broker.delay = 0.005
+    commands = [('getSymbol', {'symbol': f'SYM{i}'}) for i in range(20)]
+
+    results = pool.execute_many(commands)
+
+    assert [resp['returnData']['arguments']['symbol'] for resp in results] == [f'SYM{i}' for i in range(20)]
+    assert [session.user for session in pool.alive_sessions] == ['bob']
+    assert Counter(user for user, _ in broker.executed) == {'alice': 2, 'bob': 18}
+
+
+def test_execute_many_returns_errors_of_other_commands(pool, broker):
+    broker.drop_after['alice'] = 0
+    broker.drop_after['bob'] = 0
+    broker.refused.update({'alice', 'bob'})
+
+    results = pool.execute_many([('tradeTransaction', {}), ('getVersion', {})])
+
+    assert all(isinstance(resp, ConnectionError) for resp in results)
+    assert not pool.alive_sessions
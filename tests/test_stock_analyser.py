@@ -0,0 +1,160 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.database.database import Base
+from src.database.context import get_db_context
+from src.database.models import balance_sheet, profit_loss_statement, cashflow_statement, \
+    stock_statistics, stock_profile, country_mapping, piotroski_score_results
+from src.stockanalyser.factor_engine import FactorEngine, FACTORS
+from src.stockanalyser.stock_analyser import StockAnalyser
+
+YEARS = [date(2023, 12, 31), date(2022, 12, 31), date(2021, 12, 31)]
+
+# Three fiscal years per symbol, latest first
+STATEMENTS = {
+    # Improving on every signal
+    'GOOD-US': dict(totalAssets=[100, 90, 80], longTermDebt=[10, 20, 30], currentAssets=[50, 40, 30],
+                    currentLiabilities=[20, 25, 30], commonStock=[10, 10, 10], netIncome=[20, 10, 5],
+                    totalRevenue=[200, 150, 100], grossProfit=[100, 60, 30], operatingCashFlow=[30, 10, 5]),
+    # Zero denominators (total assets, current liabilities, revenue) score 0 instead of failing
+    'ZERO-US': dict(totalAssets=[0, 0, 0], longTermDebt=[10, 10, 10], currentAssets=[50, 40, 30],
+                    currentLiabilities=[0, 0, 0], commonStock=[12, 10, 10], netIncome=[20, 10, 5],
+                    totalRevenue=[0, 0, 0], grossProfit=[0, 0, 0], operatingCashFlow=[30, 10, 5]),
+    # Only two fiscal years cannot be scored
+    'SHORT-US': dict(totalAssets=[100, 90], longTermDebt=[10, 20], currentAssets=[50, 40],
+                     currentLiabilities=[20, 25], commonStock=[10, 10], netIncome=[20, 10],
+                     totalRevenue=[200, 150], grossProfit=[100, 60], operatingCashFlow=[30, 10]),
+    # Missing values score 0 on the signals using them
+    'NULL-DE': dict(totalAssets=[100, 90, 80], longTermDebt=[None, 20, 30], currentAssets=[50, 40, 30],
+                    currentLiabilities=[20, 25, 30], commonStock=[10, 11, 10], netIncome=[-5, 10, 5],
+                    totalRevenue=[200, 150, 100], grossProfit=[None, 60, 30], operatingCashFlow=[-1, 10, 5]),
+}
+
+MODELS = [balance_sheet.BalanceSheet, profit_loss_statement.ProfitLossStmt, cashflow_statement.CashFlowStmt]
+
+
+@pytest.fixture(scope='module')
+def analyser():
+    engine = get_db_context().engine
+    tables = [model.__table__ for model in MODELS + [stock_statistics.StockStatistics, stock_profile.StockProfile,
+                                                      country_mapping.CountryMapping,
+                                                      piotroski_score_results.PiotroskiFScore]]
+    Base.metadata.create_all(engine, tables=tables)
+    get_db_context().reflect()
+
+    for model in MODELS:
+        cols = [col.name for col in model.__table__.columns if col.name not in ('asof_date', 'ticker', 'country')]
+        rows = list()
+        for symbol, values in STATEMENTS.items():
+            ticker, country = symbol.split('-')
+            for i, asof_date in enumerate(YEARS[:len(values['totalAssets'])]):
+                rows.append(dict({col: values[col][i] for col in cols if col in values},
+                                 asof_date=asof_date, ticker=ticker, country=country))
+        pd.DataFrame(rows).to_sql(model.__tablename__, engine, if_exists='append', index=False)
+
+    symbols = [symbol.split('-') for symbol in STATEMENTS]
+    pd.DataFrame([dict(ticker=ticker, country=country, asof_date=date(2024, 1, 2), currency='USD',
+                       trailingPE=10.0 + i, marketCap=1000 * (i + 1)) for i, (ticker, country) in enumerate(symbols)]) \
+        .to_sql(stock_statistics.StockStatistics.__tablename__, engine, if_exists='append', index=False)
+    pd.DataFrame([dict(ticker=ticker, country=country, industry='Software', sector='Technology')
+                  for ticker, country in symbols]) \
+        .to_sql(stock_profile.StockProfile.__tablename__, engine, if_exists='append', index=False)
+    pd.DataFrame([dict(ticker=ticker, country=country, name=f'{ticker} Inc.') for ticker, country in symbols]) \
+        .to_sql(country_mapping.CountryMapping.__tablename__, engine, if_exists='append', index=False)
+
+    yield StockAnalyser()
+
+    for tbl in reversed(tables):
+        tbl.drop(engine)
+    get_db_context().reflect()
+
+
+def test_piotroski_batch_equals_loop(analyser):
+    symbols = list(STATEMENTS)
+    loop = analyser.piotroski_f_score(symbols, batch=False).reset_index(drop=True)
+    batch = analyser.piotroski_f_score(symbols, batch=True).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(batch.astype(str), loop.astype(str))
+
+
+def test_piotroski_scores(analyser):
+    scores = analyser.piotroski_f_score(list(STATEMENTS), batch=True).set_index('ticker')['piotroskiFScore']
+
+    assert scores['GOOD'] == 9
+    assert scores['SHORT'] == 'No Data'
+    # Only the positive cash flow signal is left when every ratio divides by zero
+    assert scores['ZERO'] == 1
+    assert scores['NULL'] == 4
+
+
+def test_scores_of_symbols_without_statements(analyser):
+    scores = analyser.piotroski_f_score(['NONE-US'], batch=True)
+    assert scores.empty
+    assert {'ticker', 'country', 'piotroskiFScore', 'lastAsofDate'} <= set(scores.columns)
+
+    factors = analyser.factor_scores(['NONE-US'])
+    assert factors.empty
+
+
+def test_factor_values():
+    base = dict(retainedEarnings=None, ebit=None, totalLiabilitiesNetMinorityInterest=None, grossProfit=None,
+                accountsReceivable=None, depreciationAndAmortization=None, sellingGeneralAndAdministration=None,
+                longTermDebt=None, operatingCashFlow=None, stockholdersEquity=None, totalDebt=None,
+                cashAndCashEquivalents=None)
+    statements = pd.DataFrame([
+        dict(base, ticker='A', country='US', asof_date=date(2023, 12, 31), totalAssets=1000, currentAssets=400,
+             currentLiabilities=200, retainedEarnings=300, ebit=150, totalLiabilitiesNetMinorityInterest=500,
+             totalRevenue=2000, grossProfit=800, accountsReceivable=200, netPPE=300, depreciationAndAmortization=50,
+             sellingGeneralAndAdministration=300, longTermDebt=100, netIncome=100, operatingCashFlow=80,
+             stockholdersEquity=500, totalDebt=200, cashAndCashEquivalents=100),
+        dict(base, ticker='A', country='US', asof_date=date(2022, 12, 31), totalAssets=800, currentAssets=300,
+             currentLiabilities=200, totalRevenue=1600, grossProfit=720, accountsReceivable=120, netPPE=300,
+             depreciationAndAmortization=60, sellingGeneralAndAdministration=240, longTermDebt=100, netIncome=50),
+        # No liabilities (zero denominator of MVE/TL) and a negative equity
+        *[dict(base, ticker='B', country='US', asof_date=asof_date, totalAssets=500, currentAssets=200,
+               currentLiabilities=100, retainedEarnings=100, ebit=100, totalLiabilitiesNetMinorityInterest=0,
+               totalRevenue=1000, grossProfit=300, accountsReceivable=100, netPPE=100, depreciationAndAmortization=20,
+               sellingGeneralAndAdministration=100, longTermDebt=50, netIncome=50, operatingCashFlow=60,
+               stockholdersEquity=-100, totalDebt=0, cashAndCashEquivalents=50)
+          for asof_date in (date(2023, 12, 31), date(2022, 12, 31))],
+        # A single fiscal year and a loss
+        dict(base, ticker='C', country='DE', asof_date=date(2023, 12, 31), totalAssets=100, currentAssets=50,
+             currentLiabilities=50, retainedEarnings=10, ebit=-10, totalLiabilitiesNetMinorityInterest=50,
+             totalRevenue=100, netPPE=50, netIncome=-5, stockholdersEquity=50, totalDebt=0,
+             cashAndCashEquivalents=0),
+    ])
+    stats = pd.DataFrame([dict(ticker='A', country='US', asof_date=date(2024, 1, 2), marketCap=1500, previousClose=15),
+                          dict(ticker='B', country='US', asof_date=date(2024, 1, 2), marketCap=450, previousClose=9),
+                          dict(ticker='C', country='DE', asof_date=date(2024, 1, 2), marketCap=100, previousClose=10)])
+
+    scores = FactorEngine(FACTORS).evaluate(statements, stats).set_index('ticker')
+
+    # Piotroski needs three fiscal years
+    assert scores['piotroskiFScore'].isna().all()
+    # 1.2 WC/TA + 1.4 RE/TA + 3.3 EBIT/TA + 0.6 MVE/TL + 1.0 Sales/TA
+    assert scores.loc['A', 'altmanZScore'] == pytest.approx(1.2 * 0.2 + 1.4 * 0.3 + 3.3 * 0.15 + 0.6 * 3 + 1.0 * 2)
+    assert np.isnan(scores.loc['B', 'altmanZScore'])
+    assert scores.loc['C', 'altmanZScore'] == pytest.approx(1.2 * 0 + 1.4 * 0.1 + 3.3 * -0.1 + 0.6 * 2 + 1.0 * 1)
+    # DSRI 0.1 / 0.075, GMI 0.45 / 0.4, AQI 0.3 / 0.25, SGI 2000 / 1600, DEPI (60 / 360) / (50 / 350),
+    # SGAI 0.15 / 0.15, TATA 20 / 1000, LVGI 0.3 / 0.375
+    assert scores.loc['A', 'beneishMScore'] == pytest.approx(
+        -4.84 + 0.920 * 0.1 / 0.075 + 0.528 * 0.45 / 0.4 + 0.404 * 0.3 / 0.25 + 0.892 * 1.25
+        + 0.115 * (60 / 360) / (50 / 350) - 0.172 * 1 + 4.679 * 0.02 - 0.327 * 0.3 / 0.375)
+    # Unchanged years leave only the accruals
+    assert scores.loc['B', 'beneishMScore'] == pytest.approx(
+        -4.84 + 0.920 + 0.528 + 0.404 + 0.892 + 0.115 - 0.172 + 4.679 * -0.02 - 0.327)
+    assert np.isnan(scores.loc['C', 'beneishMScore'])
+    # 100 shares, EPS 1 and book value per share 5
+    assert scores.loc['A', 'grahamNumber'] == pytest.approx(np.sqrt(22.5 * 1 * 5))
+    assert scores.loc['A', 'grahamUpside'] == pytest.approx(np.sqrt(22.5 * 1 * 5) / 15 - 1)
+    assert scores[['grahamNumber', 'grahamUpside']].loc[['B', 'C']].isna().all(axis=None)
+    # Earnings yield 150 / 1600, 100 / 400, -10 / 100 and return on capital 150 / 500, 100 / 200, -10 / 50
+    assert scores['magicFormulaRank'].to_dict() == {'A': 2, 'B': 1, 'C': 3}
+
+    # A column missing in the statements only leaves the factors using it without a value
+    without = FactorEngine(FACTORS).evaluate(statements.drop(columns='depreciationAndAmortization'), stats) \
+        .set_index('ticker')
+    assert without['beneishMScore'].isna().all()
+    pd.testing.assert_frame_equal(without.drop(columns='beneishMScore'), scores.drop(columns='beneishMScore'))